@@ -0,0 +1,511 @@
+"""Run Pururin against local stand-ins and report performance numbers.
+
+    python -m bench.run [--scenario feed|wikilinks|soak|members|all] [--speed 20]
+
+Nothing leaves the machine: the MediaWiki API, Reddit and Discord (REST,
+webhooks and the gateway) are all served from 127.0.0.1.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import pathlib
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+FIXTURES = pathlib.Path(__file__).resolve().parent / "fixtures"
+
+WIKI_CHANNEL_ID = "400000000000000001"
+REDDIT_CHANNEL_ID = "400000000000000002"
+CHAT_CHANNEL_IDS = [str(400000000000000010 + i) for i in range(4)]
+
+BOOT_TIMEOUT = 30
+MEMORY_MODES = ("full", "lean")
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+        "max": max(samples, default=0.0),
+    }
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def wait_for(predicate, timeout: float, interval: float = 0.05) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(interval)
+    return True
+
+
+class Harness:
+    """Owns the stand-ins and one running bot instance."""
+
+    def __init__(self, args: argparse.Namespace, loop_fixtures: bool = False):
+        from bench import standins
+
+        self.args = args
+        with open(FIXTURES / "recentchanges.json") as f:
+            self.wiki_fixture = json.load(f)
+        with open(FIXTURES / "reddit_new.json") as f:
+            reddit_fixture = json.load(f)
+
+        self.wiki = standins.MediaWikiStandIn(
+            self.wiki_fixture, args.speed, loop_fixtures, latency=args.latency
+        )
+        # A different host name gives Reddit its own rate-limit bucket in
+        # the HTTP client, as in production.
+        self.reddit = standins.RedditStandIn(
+            reddit_fixture,
+            args.speed,
+            loop_fixtures,
+            public_host="localhost",
+            latency=args.latency,
+        )
+        channels = {WIKI_CHANNEL_ID: "wiki-changes", REDDIT_CHANNEL_ID: "reddit"}
+        channels.update({cid: f"chat-{i}" for i, cid in enumerate(CHAT_CHANNEL_IDS)})
+        self.discord = standins.DiscordStandIn(channels, latency=args.latency)
+        self.bot = None
+        self._bot_task: asyncio.Task | None = None
+        self._data_dir = tempfile.TemporaryDirectory(prefix="pururin-bench-")
+
+    async def __aenter__(self):
+        for standin in (self.wiki, self.reddit, self.discord):
+            await standin.start()
+        self._configure_environment()
+
+        import discord
+        import yarl
+
+        discord.http.Route.BASE = f"{self.discord.base_url}/api/v10"
+        discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(
+            f"ws://{self.discord.host}:{self.discord.port}/gateway"
+        )
+
+        import main
+
+        self.bot = main.Pururin()
+        self._bot_task = asyncio.create_task(self.bot.start("bench-token"))
+        if not await wait_for(self._booted, BOOT_TIMEOUT):
+            raise RuntimeError("Bot did not become ready against the stand-ins")
+        return self
+
+    async def __aexit__(self, *exc):
+        if self.bot is not None:
+            await self.bot.close()
+        if self._bot_task is not None:
+            await asyncio.gather(self._bot_task, return_exceptions=True)
+        for standin in (self.discord, self.reddit, self.wiki):
+            await standin.stop()
+        self._data_dir.cleanup()
+
+    def _configure_environment(self) -> None:
+        os.environ.update(
+            {
+                "DATA_DIR": self._data_dir.name,
+                "PORT": "0",
+                "WIKI_BASE_URL": self.wiki.base_url,
+                "REDDIT_BASE_URL": self.reddit.base_url,
+                "WIKI_RC_CHANNEL_ID": WIKI_CHANNEL_ID,
+                "REDDIT_WELCOME_CHANNEL_ID": REDDIT_CHANNEL_ID,
+            }
+        )
+        if self.args.memory_mode in MEMORY_MODES:
+            os.environ["MEMORY_MODE"] = self.args.memory_mode
+        for name, value in (
+            ("WIKI_RC_POLL_MIN", "1"),
+            ("WIKI_RC_POLL_MAX", "5"),
+            ("REDDIT_POLL_MIN", "1"),
+            ("REDDIT_POLL_MAX", "5"),
+            ("LOG_LEVEL", "WARNING"),
+        ):
+            os.environ.setdefault(name, value)
+
+    def _booted(self) -> bool:
+        bot = self.bot
+        if bot is None or not bot.is_ready():
+            return False
+        fandom, reddit = bot.get_cog("Fandom"), bot.get_cog("WelcomeNHKFeed")
+        if fandom is None or reddit is None or not fandom.index.ready:  # type: ignore
+            return False
+        wikis = list(fandom.wikis.values())  # type: ignore
+        subreddits = list(reddit.subreddits.values())  # type: ignore
+        return (
+            bool(wikis and subreddits)
+            and all(w.last_rcid is not None for w in wikis)
+            and all(s.cursor is not None for s in subreddits)
+        )
+
+    def start_replay(self) -> None:
+        self.wiki.replay.start()
+        self.reddit.replay.start()
+
+    def request_counts(self) -> dict[str, dict[str, int]]:
+        return {
+            "mediawiki": dict(self.wiki.requests),
+            "reddit": dict(self.reddit.requests),
+            "discord": dict(self.discord.requests),
+        }
+
+    def reset_counts(self) -> None:
+        for standin in (self.wiki, self.reddit, self.discord):
+            standin.requests.clear()
+
+    def feed_latencies(self) -> dict[str, list[float]]:
+        """Seconds from each change becoming visible to its webhook post."""
+        lags: dict[str, list[float]] = {"fandom": [], "reddit": []}
+        for posted_at, payload in self.discord.webhook_posts:
+            for embed in payload.get("embeds", []):
+                footer = embed.get("footer", {}).get("text", "")
+                if match := re.fullmatch(r"rcid:(\d+)", footer):
+                    seq = int(match[1]) - self.wiki.RCID_BASE
+                    feed, replay = "fandom", self.wiki.replay
+                elif match := re.search(r"/comments/s(\d+)/", embed.get("url", "")):
+                    seq = int(match[1])
+                    feed, replay = "reddit", self.reddit.replay
+                else:
+                    continue
+                # Anything posted before the replay started is the bot's own
+                # baseline post, not a measured change.
+                if replay.started is None or posted_at < replay.started:
+                    continue
+                lags[feed].append(posted_at - replay.reveal_time(seq))
+        return lags
+
+    def wikilink_messages(self, count: int, seed: int = 16) -> list[str]:
+        """Chat messages mixing real titles, redirects and misses."""
+        rng = random.Random(seed)
+        fixture = self.wiki_fixture
+        known = fixture["pages"] + list(fixture["redirects"])
+        other = fixture.get("other_pages", [])
+        messages = []
+        for i in range(count):
+            refs = [rng.choice(known)]
+            for _ in range(rng.randint(0, 2)):
+                roll = rng.random()
+                if roll < 0.2 and other:
+                    refs.append(rng.choice(other))
+                elif roll < 0.35:
+                    refs.append(f"Missing page {rng.randint(0, 500)}")
+                else:
+                    refs.append(rng.choice(known).lower())
+            links = " and ".join(f"[[{ref}]]" for ref in refs)
+            messages.append(f"message {i}: have you read {links}?")
+        return messages
+
+    async def send_chat(self, content: str, channel_id: str) -> str:
+        message = self.discord.message(
+            channel_id, content, self.discord.user("500000000000000001", "reader")
+        )
+        await self.discord.dispatch("MESSAGE_CREATE", message)
+        return message["id"]
+
+    def replies(self) -> dict[str, float]:
+        """Map replied-to message ids to when the reply arrived."""
+        return {
+            str(payload["message_reference"]["message_id"]): at
+            for at, payload in self.discord.messages
+            if payload.get("message_reference")
+        }
+
+
+async def scenario_feed(args: argparse.Namespace) -> dict:
+    async with Harness(args) as h:
+        h.reset_counts()
+        h.start_replay()
+        # The item at offset 0 in each fixture is the baseline.
+        expected = len(h.wiki.replay.items) + len(h.reddit.replay.items) - 2
+        budget = (
+            max(h.wiki.replay.period, h.reddit.replay.period) / args.speed
+            + args.settle
+        )
+        await wait_for(
+            lambda: sum(len(v) for v in h.feed_latencies().values()) >= expected,
+            budget,
+            interval=0.25,
+        )
+        lags = h.feed_latencies()
+        return {
+            "edit_to_post": {feed: summarize(v) for feed, v in lags.items()},
+            "posted": sum(len(v) for v in lags.values()),
+            "expected": expected,
+            "webhook_executions": len(h.discord.webhook_posts),
+            "requests": h.request_counts(),
+        }
+
+
+async def scenario_wikilinks(args: argparse.Namespace) -> dict:
+    async with Harness(args) as h:
+        h.reset_counts()
+        messages = h.wikilink_messages(args.messages)
+        sent_at: dict[str, float] = {}
+        interval = 1 / args.rate if args.rate else 0
+
+        started = time.time()
+        for i, content in enumerate(messages):
+            channel_id = CHAT_CHANNEL_IDS[i % len(CHAT_CHANNEL_IDS)]
+            message_id = await h.send_chat(content, channel_id)
+            sent_at[message_id] = time.time()
+            if interval:
+                await asyncio.sleep(interval)
+
+        await wait_for(lambda: len(h.replies()) >= len(messages), args.settle)
+        replies = h.replies()
+        finished = max(replies.values(), default=time.time())
+        latencies = [replies[m] - t for m, t in sent_at.items() if m in replies]
+        return {
+            "messages": len(messages),
+            "replied": len(latencies),
+            "messages_per_second": len(latencies) / max(finished - started, 1e-9),
+            "reply_latency": summarize(latencies),
+            "requests": h.request_counts(),
+        }
+
+
+async def chat_traffic(h: Harness, rate: float, messages: list[str]) -> None:
+    """Send wikilink messages at a steady rate until cancelled."""
+    interval = 1 / rate if rate else 0.05
+    sent = 0
+    while True:
+        channel_id = CHAT_CHANNEL_IDS[sent % len(CHAT_CHANNEL_IDS)]
+        await h.send_chat(messages[sent % len(messages)], channel_id)
+        sent += 1
+        await asyncio.sleep(interval)
+
+
+def traced_snapshot() -> tracemalloc.Snapshot:
+    """Snapshot of allocations made outside the harness and stand-ins."""
+    return tracemalloc.take_snapshot().filter_traces(
+        [
+            tracemalloc.Filter(False, str(pathlib.Path(__file__).parent / "*")),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ]
+    )
+
+
+async def scenario_soak(args: argparse.Namespace) -> dict:
+    tracemalloc.start()
+    async with Harness(args, loop_fixtures=True) as h:
+        h.reset_counts()
+        h.start_replay()
+        traffic = asyncio.create_task(
+            chat_traffic(h, args.rate or 5, h.wikilink_messages(1000))
+        )
+
+        # Let caches and pools warm up before taking the baseline.
+        await asyncio.sleep(args.settle)
+        first = traced_snapshot()
+        samples = []
+        started = time.monotonic()
+        while True:
+            elapsed = time.monotonic() - started
+            traced = traced_snapshot()
+            samples.append(
+                {
+                    "t": round(elapsed, 1),
+                    "rss": rss_bytes(),
+                    "traced": sum(t.size for t in traced.traces),
+                }
+            )
+            if elapsed >= args.duration:
+                break
+            await asyncio.sleep(min(args.sample_every, args.duration - elapsed))
+
+        traffic.cancel()
+        top = [
+            {"where": str(stat.traceback[0]), "size_diff": stat.size_diff}
+            for stat in traced.compare_to(first, "lineno")[:10]
+        ]
+        result = {
+            "duration": args.duration,
+            "messages_replied": len(h.replies()),
+            "feed_posts": len(h.discord.webhook_posts),
+            "rss_growth": samples[-1]["rss"] - samples[0]["rss"],
+            "traced_growth": samples[-1]["traced"] - samples[0]["traced"],
+            "samples": samples,
+            "top_growth": top,
+            "requests": h.request_counts(),
+        }
+    tracemalloc.stop()
+    return result
+
+
+async def scenario_members(args: argparse.Namespace) -> dict:
+    """Memory held per 10k members after a wave of joins."""
+    from bench import standins
+
+    tracemalloc.start()
+    async with Harness(args) as h:
+        import memory
+
+        guild = h.bot.get_guild(int(standins.GUILD_ID))  # type: ignore
+        expected = guild.member_count + args.members  # type: ignore
+        gc.collect()
+        traced_before = sum(t.size for t in traced_snapshot().traces)
+        rss_before = rss_bytes()
+
+        for i in range(args.members):
+            payload = h.discord.member(str(600000000000000000 + i), f"member{i}")
+            await h.discord.dispatch("GUILD_MEMBER_ADD", payload)
+        await wait_for(lambda: guild.member_count >= expected, args.settle)  # type: ignore
+
+        gc.collect()
+        traced = sum(t.size for t in traced_snapshot().traces) - traced_before
+        scale = 10000 / max(args.members, 1)
+        result = {
+            "memory_mode": memory.MEMORY_MODE,
+            "joins": args.members,
+            "cached_members": len(guild.members),  # type: ignore
+            "cached_users": len(h.bot.users),  # type: ignore
+            "traced_per_10k_members": int(traced * scale),
+            "rss_per_10k_members": int((rss_bytes() - rss_before) * scale),
+        }
+    tracemalloc.stop()
+    return result
+
+
+SCENARIOS = {
+    "feed": scenario_feed,
+    "wikilinks": scenario_wikilinks,
+    "soak": scenario_soak,
+    "members": scenario_members,
+}
+
+
+def print_report(name: str, result: dict) -> None:
+    print(f"\n== {name} ==")
+    for key, value in result.items():
+        if key in ("samples", "top_growth"):
+            continue
+        if key == "requests":
+            for service, routes in value.items():
+                total = sum(routes.values())
+                print(f"  requests[{service}]: {total}")
+                for route, count in sorted(routes.items()):
+                    print(f"      {count:6d}  {route}")
+            continue
+        if isinstance(value, dict):
+            print(f"  {key}:")
+            for sub, stats in value.items():
+                if isinstance(stats, dict):
+                    stats = ", ".join(
+                        f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}"
+                        for k, v in stats.items()
+                    )
+                elif isinstance(stats, float):
+                    stats = f"{stats:.3f}"
+                print(f"    {sub}: {stats}")
+        elif isinstance(value, float):
+            print(f"  {key}: {value:.3f}")
+        else:
+            print(f"  {key}: {value}")
+    for stat in result.get("top_growth", [])[:5]:
+        print(f"    {stat['size_diff']:+10d} B  {stat['where']}")
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=[*SCENARIOS, "all"], default="all")
+    parser.add_argument(
+        "--speed", type=float, default=20, help="fixture replay speed-up factor"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="added stand-in response time"
+    )
+    parser.add_argument(
+        "--messages", type=int, default=2000, help="messages in the wikilinks run"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0, help="messages per second (0 = flat out)"
+    )
+    parser.add_argument("--duration", type=float, default=300, help="soak seconds")
+    parser.add_argument(
+        "--members", type=int, default=10000, help="joins in the members run"
+    )
+    parser.add_argument(
+        "--memory-mode",
+        choices=[*MEMORY_MODES, "compare"],
+        default="compare",
+        help="MEMORY_MODE for the bot; compare runs members once per mode",
+    )
+    parser.add_argument("--sample-every", type=float, default=30)
+    parser.add_argument(
+        "--settle", type=float, default=30, help="seconds to wait for stragglers"
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def run_isolated(names: list[str], argv: list[str]) -> dict:
+    """Run each scenario in a fresh interpreter.
+
+    Module-level configuration and the SQLite state are read once per
+    process, so scenarios cannot share one.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in names:
+            out = os.path.join(tmp, f"{name}.json")
+            cmd = [sys.executable, "-m", "bench.run", *argv]
+            subprocess.run([*cmd, "--scenario", name, "--json", out], check=True)
+            with open(out) as f:
+                results.update(json.load(f))
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+
+    if args.scenario == "all":
+        names = [name for name in SCENARIOS if name not in ("soak", "members")]
+        results = run_isolated(names, argv)
+    elif args.scenario == "members" and args.memory_mode == "compare":
+        results = {
+            f"members[{mode}]": run_isolated(
+                ["members"], [*argv, "--memory-mode", mode]
+            )["members"]
+            for mode in MEMORY_MODES
+        }
+    else:
+        results = {args.scenario: asyncio.run(SCENARIOS[args.scenario](args))}
+        print_report(args.scenario, results[args.scenario])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
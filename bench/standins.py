@@ -0,0 +1,598 @@
+"""Local aiohttp stand-ins for the MediaWiki API, Reddit and Discord.
+
+Each stand-in counts the requests it serves per route so scenarios can
+report outbound request volume. Feed fixtures are replayed on a clock that
+runs ``speed`` times faster than the recording.
+"""
+
+import asyncio
+import bisect
+import collections
+import datetime
+import hashlib
+import itertools
+import json
+import time
+from aiohttp import WSMsgType, web
+
+BOT_USER_ID = "100000000000000001"
+APPLICATION_ID = "100000000000000002"
+OWNER_ID = "100000000000000003"
+GUILD_ID = "200000000000000001"
+
+NAMESPACES = {
+    0: "",
+    2: "User",
+    4: "Project",
+    6: "File",
+    10: "Template",
+    12: "Help",
+    14: "Category",
+}
+
+
+def json_response(data, status: int = 200) -> web.Response:
+    # discord.py only decodes bodies whose content type is exactly
+    # "application/json", without a charset parameter.
+    return web.Response(
+        body=json.dumps(data).encode(), status=status, content_type="application/json"
+    )
+
+
+def iso(ts: float) -> str:
+    when = datetime.datetime.fromtimestamp(int(ts), tz=datetime.timezone.utc)
+    return when.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class StandIn:
+    """Base class: an aiohttp app on its own port with request counting."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        public_host: str | None = None,
+        latency: float = 0.0,
+    ):
+        self.host = host
+        self.public_host = public_host or host
+        self.latency = latency
+        self.requests: collections.Counter[str] = collections.Counter()
+        self.app = web.Application(middlewares=[self._count])
+        self._runner: web.AppRunner | None = None
+        self.port = 0
+
+    @web.middleware
+    async def _count(self, request: web.Request, handler):
+        route = request.match_info.route.resource
+        name = route.canonical if route is not None else request.path
+        self.requests[f"{request.method} {name}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.public_host}:{self.port}"
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]  # type: ignore
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class Replay:
+    """Reveals fixture items as an accelerated clock passes their offsets.
+
+    Until ``start()`` only items at offset 0 are visible, which gives the
+    bot a baseline to take its cursor from. With ``loop`` the fixture
+    repeats forever; every revealed item gets a new sequence number.
+    """
+
+    def __init__(self, items: list[dict], speed: float, loop: bool = False):
+        self.items = sorted(items, key=lambda i: i["at"])
+        self.offsets = [i["at"] for i in self.items]
+        self.period = self.offsets[-1] + 1
+        self.speed = speed
+        self.loop = loop
+        self.started: float | None = None
+
+    def start(self) -> None:
+        self.started = time.time()
+
+    def reveal_time(self, seq: int) -> float:
+        cycle, index = divmod(seq, len(self.items))
+        started = self.started if self.started is not None else time.time()
+        return started + (cycle * self.period + self.offsets[index]) / self.speed
+
+    def revealed(self) -> int:
+        """Number of items revealed so far."""
+        if self.started is None:
+            return bisect.bisect_right(self.offsets, 0)
+        elapsed = (time.time() - self.started) * self.speed
+        if not self.loop:
+            return bisect.bisect_right(self.offsets, elapsed)
+        cycle, within = divmod(elapsed, self.period)
+        return int(cycle) * len(self.items) + bisect.bisect_right(self.offsets, within)
+
+    def visible(self, window: int = 500) -> list[tuple[int, dict, float]]:
+        """The newest ``window`` revealed items as (seq, item, revealed_at)."""
+        total = self.revealed()
+        return [
+            (seq, self.items[seq % len(self.items)], self.reveal_time(seq))
+            for seq in range(max(0, total - window), total)
+        ]
+
+    @property
+    def finished(self) -> bool:
+        return not self.loop and self.revealed() == len(self.items)
+
+
+class MediaWikiStandIn(StandIn):
+    RCID_BASE = 1000
+    REVID_BASE = 5000
+    # Parent revisions get their own range so every revid maps to one change.
+    PARENT_REVID_BASE = 90000
+
+    def __init__(self, fixture: dict, speed: float, loop: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.pages: set[str] = set(fixture["pages"])
+        self.other_pages: set[str] = set(fixture.get("other_pages", []))
+        self.redirects: dict[str, str] = dict(fixture.get("redirects", {}))
+        self.replay = Replay(fixture["changes"], speed, loop)
+        self.app.router.add_get("/api.php", self.handle_api)
+
+    def change_payload(self, seq: int, item: dict, at: float) -> dict:
+        kind = item.get("type", "edit")
+        change = {
+            "type": kind,
+            "ns": 0,
+            "title": item["title"],
+            "rcid": self.RCID_BASE + seq,
+            "revid": 0 if kind == "log" else self.REVID_BASE + seq,
+            "old_revid": self.PARENT_REVID_BASE + seq if kind == "edit" else 0,
+            "user": item.get("user", "Editor"),
+            "comment": item.get("comment", ""),
+            "timestamp": iso(at),
+            "oldlen": item.get("oldlen", 100),
+            "newlen": item.get("newlen", 120),
+        }
+        if item.get("minor"):
+            change["minor"] = ""
+        if kind == "new":
+            change["new"] = ""
+        for key in ("logtype", "logaction", "logparams"):
+            if key in item:
+                change[key] = item[key]
+        return change
+
+    async def handle_api(self, request: web.Request) -> web.Response:
+        q = request.query
+        if q.get("list") == "recentchanges":
+            return json_response(self.recentchanges(q))
+        if q.get("titles"):
+            return json_response(self.titles(q["titles"].split("|")))
+        if q.get("prop") == "revisions" and q.get("revids"):
+            return json_response(self.revisions(q["revids"].split("|")))
+        if q.get("list") == "allpages":
+            pages = sorted(self.pages | set(self.redirects))
+            return json_response(
+                {
+                    "query": {
+                        "allpages": [
+                            {"pageid": i + 1, "ns": 0, "title": t}
+                            for i, t in enumerate(pages)
+                        ]
+                    }
+                }
+            )
+        if q.get("list") == "allredirects":
+            pages = sorted(self.pages | set(self.redirects))
+            ids = {t: i + 1 for i, t in enumerate(pages)}
+            return json_response(
+                {
+                    "query": {
+                        "allredirects": [
+                            {"fromid": ids[src], "ns": 0, "title": dst}
+                            for src, dst in self.redirects.items()
+                        ]
+                    }
+                }
+            )
+        if q.get("meta") == "siteinfo":
+            return json_response(
+                {
+                    "query": {
+                        "namespaces": {
+                            str(ns_id): {"id": ns_id, "name": name, "canonical": name}
+                            for ns_id, name in NAMESPACES.items()
+                        },
+                        "namespacealiases": [],
+                    }
+                }
+            )
+        return json_response({"error": {"code": "unknown"}})
+
+    def recentchanges(self, q) -> dict:
+        changes = [
+            self.change_payload(seq, item, at)
+            for seq, item, at in self.replay.visible()
+        ]
+        if q.get("rcdir") == "newer":
+            if rcstart := q.get("rcstart"):
+                changes = [c for c in changes if c["timestamp"] >= rcstart]
+        else:
+            changes.reverse()
+            if rcend := q.get("rcend"):
+                changes = [c for c in changes if c["timestamp"] >= rcend]
+        offset = int(q.get("rccontinue", "0"))
+        limit = int(q.get("rclimit", "10"))
+        page = changes[offset : offset + limit]
+        data: dict = {"query": {"recentchanges": page}}
+        if offset + limit < len(changes):
+            data["continue"] = {"rccontinue": str(offset + limit), "continue": "-||"}
+        return data
+
+    def revision_text(self, revid: int) -> tuple[str, str]:
+        """(title, content) of a synthetic revision; edits change two lines."""
+        parent = revid >= self.PARENT_REVID_BASE
+        seq = revid - (self.PARENT_REVID_BASE if parent else self.REVID_BASE)
+        item = self.replay.items[seq % len(self.replay.items)]
+        lines = [f"{item['title']} paragraph {i}." for i in range(40)]
+        if not parent:
+            lines[seq % 40] = f"{item.get('comment', 'Edited')} (rev {revid})."
+            lines.append(f"Added in revision {revid}.")
+        return item["title"], "\n".join(lines)
+
+    def revisions(self, revids: list[str]) -> dict:
+        pages: dict[str, dict] = {}
+        for revid in map(int, revids):
+            title, content = self.revision_text(revid)
+            page = pages.setdefault(
+                str(abs(hash(title)) % 10**6),
+                {"ns": 0, "title": title, "revisions": []},
+            )
+            page["revisions"].append(
+                {
+                    "revid": revid,
+                    "slots": {"main": {"contentmodel": "wikitext", "*": content}},
+                }
+            )
+        return {"query": {"pages": pages}}
+
+    def titles(self, titles: list[str]) -> dict:
+        normalized, redirects, pages = [], [], {}
+        missing = -1
+        for title in titles:
+            norm = title.replace("_", " ")
+            norm = norm[:1].upper() + norm[1:]
+            if norm != title:
+                normalized.append({"from": title, "to": norm})
+            if norm in self.redirects:
+                redirects.append({"from": norm, "to": self.redirects[norm]})
+                norm = self.redirects[norm]
+            if norm in self.pages or norm in self.other_pages:
+                pages[str(abs(hash(norm)) % 10**6)] = {"ns": 0, "title": norm}
+            else:
+                pages[str(missing)] = {"ns": 0, "title": norm, "missing": ""}
+                missing -= 1
+        query: dict = {"pages": pages}
+        if normalized:
+            query["normalized"] = normalized
+        if redirects:
+            query["redirects"] = redirects
+        return {"query": query}
+
+
+class RedditStandIn(StandIn):
+    def __init__(self, fixture: dict, speed: float, loop: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.replay = Replay(fixture["posts"], speed, loop)
+        self.app.router.add_get("/r/{sub}/new.json", self.handle_new)
+
+    @staticmethod
+    def post_id(seq: int) -> str:
+        return f"s{seq}"
+
+    def post_payload(self, seq: int, item: dict, at: float) -> dict:
+        post_id = self.post_id(seq)
+        return {
+            "id": post_id,
+            "name": f"t3_{post_id}",
+            "title": item["title"],
+            "selftext": item.get("selftext", ""),
+            "author": item.get("author", "poster"),
+            "permalink": f"/r/WelcomeToTheNHK/comments/{post_id}/",
+            "created_utc": at,
+            "ups": item.get("ups", 1),
+            "num_comments": item.get("num_comments", 0),
+            "link_flair_text": item.get("link_flair_text"),
+        }
+
+    async def handle_new(self, request: web.Request) -> web.Response:
+        posts = [
+            self.post_payload(seq, item, at) for seq, item, at in self.replay.visible()
+        ]
+        posts.reverse()
+        if before := request.query.get("before"):
+            names = [p["name"] for p in posts]
+            posts = posts[: names.index(before)] if before in names else []
+        posts = posts[: int(request.query.get("limit", "25"))]
+
+        body = json.dumps(
+            {"data": {"children": [{"kind": "t3", "data": p} for p in posts]}}
+        )
+        etag = '"' + hashlib.sha1(body.encode()).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(
+            text=body, content_type="application/json", headers={"ETag": etag}
+        )
+
+
+class DiscordStandIn(StandIn):
+    """Discord REST routes the bot uses, plus a minimal JSON gateway."""
+
+    def __init__(self, channels: dict[str, str], **kwargs):
+        super().__init__(**kwargs)
+        self.channels = channels
+        self.snowflakes = itertools.count(300000000000000000)
+        self.webhooks: dict[str, dict] = {}
+        self.webhook_posts: list[tuple[float, dict]] = []
+        self.messages: list[tuple[float, dict]] = []
+        self.role_adds: list[tuple[float, str]] = []
+        self._sockets: list[web.WebSocketResponse] = []
+        self._seq = itertools.count(1)
+        self.identified = asyncio.Event()
+
+        r = self.app.router
+        r.add_get("/api/v10/users/@me", self.handle_me)
+        r.add_get("/api/v10/oauth2/applications/@me", self.handle_application)
+        r.add_get("/api/v10/gateway/bot", self.handle_gateway_bot)
+        r.add_put("/api/v10/applications/{app}/commands", self.handle_sync)
+        r.add_get("/api/v10/channels/{channel}/webhooks", self.handle_list_webhooks)
+        r.add_post("/api/v10/channels/{channel}/webhooks", self.handle_create_webhook)
+        r.add_post("/api/v10/webhooks/{id}/{token}", self.handle_execute_webhook)
+        r.add_get("/api/v10/channels/{channel}/messages", self.handle_history)
+        r.add_post(
+            "/api/v10/channels/{channel}/messages", self.handle_create_message
+        )
+        r.add_put(
+            "/api/v10/guilds/{guild}/members/{member}/roles/{role}",
+            self.handle_add_role,
+        )
+        r.add_get("/gateway", self.handle_gateway)
+
+    def user(self, user_id: str, name: str, bot: bool = False) -> dict:
+        return {
+            "id": user_id,
+            "username": name,
+            "discriminator": "0",
+            "global_name": name,
+            "avatar": None,
+            "bot": bot,
+        }
+
+    async def handle_me(self, request):
+        return json_response(self.user(BOT_USER_ID, "Pururin", bot=True))
+
+    async def handle_application(self, request):
+        return json_response(
+            {
+                "id": APPLICATION_ID,
+                "name": "Pururin",
+                "icon": None,
+                "description": "",
+                "rpc_origins": [],
+                "bot_public": True,
+                "bot_require_code_grant": False,
+                "owner": self.user(OWNER_ID, "owner"),
+                "team": None,
+                "verify_key": "0" * 64,
+                "flags": 0,
+                "summary": "",
+            }
+        )
+
+    async def handle_gateway_bot(self, request):
+        return json_response(
+            {
+                "url": f"ws://{self.host}:{self.port}/gateway",
+                "shards": 1,
+                "session_start_limit": {
+                    "total": 1000,
+                    "remaining": 1000,
+                    "reset_after": 0,
+                    "max_concurrency": 1,
+                },
+            }
+        )
+
+    async def handle_sync(self, request):
+        return json_response([])
+
+    async def handle_list_webhooks(self, request):
+        channel = request.match_info["channel"]
+        return json_response(
+            [w for w in self.webhooks.values() if w["channel_id"] == channel]
+        )
+
+    async def handle_create_webhook(self, request):
+        payload = await request.json()
+        webhook_id = str(next(self.snowflakes))
+        webhook = {
+            "id": webhook_id,
+            "type": 1,
+            "token": f"token{webhook_id}",
+            "channel_id": request.match_info["channel"],
+            "guild_id": GUILD_ID,
+            "name": payload.get("name"),
+            "avatar": None,
+            "application_id": APPLICATION_ID,
+        }
+        self.webhooks[webhook_id] = webhook
+        return json_response(webhook)
+
+    async def handle_execute_webhook(self, request):
+        if request.match_info["id"] not in self.webhooks:
+            return json_response(
+                {"message": "Unknown Webhook", "code": 10015}, status=404
+            )
+        payload = await request.json()
+        # Keep only what the scenarios read so soak runs measure the bot,
+        # not this recorder.
+        embeds = [
+            {"footer": e.get("footer", {}), "url": e.get("url", "")}
+            for e in payload.get("embeds", [])
+        ]
+        self.webhook_posts.append((time.time(), {"embeds": embeds}))
+        return web.Response(status=204)
+
+    async def handle_history(self, request):
+        return json_response([])
+
+    async def handle_create_message(self, request):
+        payload = await request.json()
+        self.messages.append(
+            (time.time(), {"message_reference": payload.get("message_reference")})
+        )
+        return json_response(
+            self.message(
+                request.match_info["channel"],
+                payload.get("content", ""),
+                self.user(BOT_USER_ID, "Pururin", bot=True),
+            )
+        )
+
+    async def handle_add_role(self, request):
+        self.role_adds.append((time.time(), request.match_info["member"]))
+        return web.Response(status=204)
+
+    def message(self, channel_id: str, content: str, author: dict) -> dict:
+        return {
+            "id": str(next(self.snowflakes)),
+            "channel_id": channel_id,
+            "guild_id": GUILD_ID,
+            "author": author,
+            "content": content,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": [],
+            "pinned": False,
+            "type": 0,
+        }
+
+    def member(self, user_id: str, name: str) -> dict:
+        """GUILD_MEMBER_ADD payload for a new member of the bench guild."""
+        return {
+            "guild_id": GUILD_ID,
+            "user": self.user(user_id, name),
+            "nick": None,
+            "roles": [],
+            "joined_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "deaf": False,
+            "mute": False,
+            "flags": 0,
+        }
+
+    def guild_payload(self) -> dict:
+        return {
+            "id": GUILD_ID,
+            "name": "Bench Guild",
+            "icon": None,
+            "owner_id": OWNER_ID,
+            "afk_timeout": 300,
+            "verification_level": 0,
+            "default_message_notifications": 0,
+            "explicit_content_filter": 0,
+            "features": [],
+            "mfa_level": 0,
+            "system_channel_flags": 0,
+            "premium_tier": 0,
+            "nsfw_level": 0,
+            "preferred_locale": "en-US",
+            "member_count": 1,
+            "large": False,
+            "unavailable": False,
+            "emojis": [],
+            "stickers": [],
+            "roles": [
+                {
+                    "id": GUILD_ID,
+                    "name": "@everyone",
+                    "permissions": "0",
+                    "position": 0,
+                    "color": 0,
+                    "hoist": False,
+                    "managed": False,
+                    "mentionable": False,
+                    "flags": 0,
+                }
+            ],
+            "channels": [
+                {
+                    "id": channel_id,
+                    "type": 0,
+                    "name": name,
+                    "position": i,
+                    "permission_overwrites": [],
+                    "nsfw": False,
+                    "parent_id": None,
+                    "guild_id": GUILD_ID,
+                }
+                for i, (channel_id, name) in enumerate(self.channels.items())
+            ],
+            "members": [],
+            "threads": [],
+            "presences": [],
+            "voice_states": [],
+            "stage_instances": [],
+            "guild_scheduled_events": [],
+        }
+
+    async def dispatch(self, event: str, data: dict) -> None:
+        payload = json.dumps({"op": 0, "t": event, "s": next(self._seq), "d": data})
+        for ws in list(self._sockets):
+            if not ws.closed:
+                await ws.send_str(payload)
+
+    async def handle_gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._sockets.append(ws)
+        await ws.send_json({"op": 10, "d": {"heartbeat_interval": 41250}})
+
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            data = json.loads(msg.data)
+            if data["op"] == 1:
+                await ws.send_json({"op": 11})
+            elif data["op"] == 2:
+                await self.dispatch(
+                    "READY",
+                    {
+                        "v": 10,
+                        "user": self.user(BOT_USER_ID, "Pururin", bot=True),
+                        "guilds": [{"id": GUILD_ID, "unavailable": True}],
+                        "session_id": "bench",
+                        "shard": data["d"].get("shard", [0, 1]),
+                        "resume_gateway_url": f"ws://{self.host}:{self.port}/gateway",
+                        "application": {"id": APPLICATION_ID, "flags": 0},
+                    },
+                )
+                await self.dispatch("GUILD_CREATE", self.guild_payload())
+                self.identified.set()
+
+        self._sockets.remove(ws)
+        return ws
@@ -0,0 +1,177 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+import discord
+import metrics
+import mylogger
+import utils
+
+logger = mylogger.getLogger(__name__)
+
+INTERACTIVE = 0
+NORMAL = 1
+FEED = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", FEED: "feed"}
+
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+
+
+class _Job:
+    __slots__ = ("kwargs", "future", "enqueued_at")
+
+    def __init__(self, kwargs: dict, future: asyncio.Future):
+        self.kwargs = kwargs
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class Dispatcher:
+    """Prioritized queue for everything the bot sends to Discord.
+
+    Jobs are grouped by destination (the route Discord rate-limits on) and
+    each destination has at most one request in flight. Feed embeds queued
+    for the same webhook are packed into a single execution of up to ten
+    embeds. Lower priority values are sent first.
+    """
+
+    def __init__(self, workers: int = 4, latency_samples: int = 1024):
+        self.workers = workers
+        self.latencies: deque[float] = deque(maxlen=latency_samples)
+        self.sent = 0
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._pending: dict[tuple, deque[_Job]] = {}
+        self._targets: dict[tuple, object] = {}
+        self._seq = itertools.count()
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs waiting to be sent."""
+        return sum(len(jobs) for jobs in self._pending.values())
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"outbound-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` for every queued send; False if some remain."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def send_webhook(
+        self,
+        channel: discord.abc.Messageable,
+        name: str,
+        *,
+        embed: discord.Embed,
+        username: str | None = None,
+        priority: int = FEED,
+    ) -> asyncio.Future:
+        """Queue an embed for the channel's ``name`` webhook."""
+        key = (priority, "webhook", channel.id, name, username)  # type: ignore
+        return self._enqueue(key, (channel, name, username), {"embed": embed})
+
+    def send_message(
+        self, channel: discord.abc.Messageable, *, priority: int = INTERACTIVE, **kwargs
+    ) -> asyncio.Future:
+        """Queue ``channel.send(**kwargs)``."""
+        key = (priority, "message", channel.id)  # type: ignore
+        return self._enqueue(key, channel, kwargs)
+
+    def stats(self) -> dict[str, float]:
+        """Queue depth, messages sent and enqueue-to-send latency percentiles."""
+        samples = sorted(self.latencies)
+        stats = {"depth": self.depth, "sent": self.sent}
+        for pct in (50, 95, 99):
+            stats[f"p{pct}"] = (
+                samples[min(len(samples) - 1, len(samples) * pct // 100)]
+                if samples
+                else 0.0
+            )
+        return stats
+
+    def _enqueue(self, key: tuple, target, kwargs: dict) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        jobs = self._pending.get(key)
+        if jobs is None:
+            jobs = self._pending[key] = deque()
+            self._targets[key] = target
+            self._queue.put_nowait((key[0], next(self._seq), key))
+        jobs.append(_Job(kwargs, future))
+        return future
+
+    def _take_batch(self, key: tuple, jobs: deque[_Job]) -> list[_Job]:
+        if key[1] != "webhook":
+            return [jobs.popleft()]
+
+        batch: list[_Job] = []
+        chars = 0
+        while jobs and len(batch) < MAX_EMBEDS_PER_MESSAGE:
+            size = len(jobs[0].kwargs["embed"])
+            if batch and chars + size > MAX_EMBED_CHARS_PER_MESSAGE:
+                break
+            chars += size
+            batch.append(jobs.popleft())
+        return batch
+
+    async def _worker(self) -> None:
+        while True:
+            priority, _, key = await self._queue.get()
+            jobs = self._pending[key]
+            batch = self._take_batch(key, jobs)
+            try:
+                await self._execute(key, batch)
+            finally:
+                # New jobs for this destination may have arrived while we
+                # were sending; they go back in line behind other routes.
+                if jobs:
+                    self._queue.put_nowait((priority, next(self._seq), key))
+                else:
+                    del self._pending[key]
+                    del self._targets[key]
+                self._queue.task_done()
+
+    async def _execute(self, key: tuple, batch: list[_Job]) -> None:
+        target = self._targets[key]
+        try:
+            if key[1] == "webhook":
+                channel, name, username = target  # type: ignore
+                kwargs = {"embeds": [job.kwargs["embed"] for job in batch]}
+                if username:
+                    kwargs["username"] = username
+                started = time.perf_counter()
+                result = await utils.WebhookHelper.send_via_webhook(
+                    channel, name, **kwargs
+                )
+                metrics.WEBHOOK_SEND_DURATION.observe(time.perf_counter() - started)
+            else:
+                result = await target.send(**batch[0].kwargs)  # type: ignore
+        except Exception as e:
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            return
+
+        now = time.monotonic()
+        self.sent += len(batch)
+        wait = metrics.OUTBOUND_WAIT.labels(PRIORITY_NAMES.get(key[0], key[0]))
+        for job in batch:
+            self.latencies.append(now - job.enqueued_at)
+            wait.observe(now - job.enqueued_at)
+            if not job.future.done():
+                job.future.set_result(result)
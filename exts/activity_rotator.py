@@ -2,9 +2,12 @@ from discord.ext import commands, tasks
 import discord
 import itertools
 import mylogger
+import profiler
 
 logger = mylogger.getLogger(__name__)
 
+LAZY = True
+
 ACTIVITIES = [
     discord.Activity(type=discord.ActivityType.playing, name="Purupuru Pururin~ 🎶"),
     discord.Activity(
@@ -30,6 +33,7 @@ class ActivityRotator(commands.Cog):
         self.rotate_status.start()
 
     @tasks.loop(minutes=10)
+    @profiler.timed
     async def rotate_status(self):
         activity = next(self.activities)
         await self.bot.change_presence(activity=activity)
@@ -0,0 +1,114 @@
+import asyncio
+import os
+from discord.ext import commands, tasks
+import mylogger
+import profiler
+
+logger = mylogger.getLogger(__name__)
+
+LAZY = True
+
+EXTS_DIR = "exts"
+WATCH_EXTENSIONS = os.getenv("EXT_WATCH", "false").lower() in ("1", "true", "yes")
+WATCH_INTERVAL_SECONDS = 2
+HOT_REPORT_LIMIT = 1900
+
+
+def scan_extensions() -> dict[str, float]:
+    """Map each extension module name to its source file's mtime."""
+    mtimes = {}
+    for filename in os.listdir(EXTS_DIR):
+        if filename.endswith(".py") and filename != "__init__.py":
+            path = os.path.join(EXTS_DIR, filename)
+            mtimes[f"{EXTS_DIR}.{filename[:-3]}"] = os.stat(path).st_mtime
+    return mtimes
+
+
+class Admin(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.mtimes: dict[str, float] = {}
+        if WATCH_EXTENSIONS:
+            self.watch_extensions.start()
+
+    async def cog_unload(self):
+        self.watch_extensions.cancel()
+
+    async def reload(self, name: str) -> None:
+        """Reload (or load, if new) an extension and resync commands."""
+        if name in self.bot.extensions:
+            await self.bot.reload_extension(name)
+        else:
+            await self.bot.load_extension(name)
+        logger.info(f"Reloaded extension {name}")
+        if sync := getattr(self.bot, "sync_commands", None):
+            await sync()
+
+    @commands.command(name="reload")
+    @commands.is_owner()
+    async def reload_command(self, ctx: commands.Context, extension: str):
+        name = extension
+        if not name.startswith(f"{EXTS_DIR}."):
+            name = f"{EXTS_DIR}.{name}"
+        try:
+            await self.reload(name)
+        except commands.ExtensionError as e:
+            await ctx.send(f"⚠️ Failed to reload `{name}`: {e}")
+            return
+        await ctx.send(f"🔁 Reloaded `{name}`")
+
+    @commands.command(name="hot")
+    @commands.is_owner()
+    async def hot_command(self, ctx: commands.Context, count: int = 10):
+        """Show the handlers that took the most time, and event-loop lag."""
+        lag = profiler.lag_monitor.percentiles()
+        outbound = self.bot.outbound.stats()  # type: ignore
+        lines = [
+            "Loop lag (ms): "
+            + "  ".join(f"{k} {v * 1000:.1f}" for k, v in lag.items()),
+            f"Outbound: {outbound['depth']} queued, {outbound['sent']} sent, wait (ms) "
+            + "  ".join(f"p{p} {outbound[f'p{p}'] * 1000:.1f}" for p in (50, 95, 99)),
+            "",
+            "  total s   calls   avg ms   max ms  slow  handler",
+        ]
+        for name, stats in profiler.handlers.top(max(1, min(count, 25))):
+            lines.append(
+                f"{stats.total:9.2f} {stats.count:7d} "
+                f"{stats.total / stats.count * 1000:8.1f} {stats.max * 1000:8.1f} "
+                f"{stats.slow:5d}  {name}"
+            )
+        report = "\n".join(lines)[:HOT_REPORT_LIMIT]
+        await ctx.send(f"```\n{report}\n```")
+
+    @tasks.loop(seconds=WATCH_INTERVAL_SECONDS)
+    @profiler.timed
+    async def watch_extensions(self):
+        mtimes = await asyncio.to_thread(scan_extensions)
+        if not self.mtimes:
+            self.mtimes = mtimes
+            return
+
+        changed = [
+            name for name, mtime in mtimes.items() if self.mtimes.get(name) != mtime
+        ]
+        self.mtimes = mtimes
+        for name in changed:
+            # Reloading this cog cancels this loop, so run each reload as its
+            # own task instead of awaiting it here.
+            self.bot.spawn(  # type: ignore
+                self._reload_changed(name), name=f"reload-{name}"
+            )
+
+    async def _reload_changed(self, name: str) -> None:
+        try:
+            await self.reload(name)
+        except commands.ExtensionError as e:
+            logger.error(f"Failed to reload {name}: {e}")
+
+    @watch_extensions.before_loop
+    async def before_watch(self):
+        await self.bot.wait_until_ready()
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Admin(bot))
@@ -0,0 +1,285 @@
+import datetime
+import os
+import time
+from collections import deque
+import discord
+from discord import app_commands
+from discord.ext import commands
+import dispatcher
+import feedpoller
+import mylogger
+import storage
+
+logger = mylogger.getLogger(__name__)
+
+CHANNEL_ID = int(
+    os.getenv("WIKI_DIGEST_CHANNEL_ID", os.getenv("WIKI_RC_CHANNEL_ID", "0"))
+)
+PERIOD_DAYS = {"daily": 1, "weekly": 7}
+PERIOD = os.getenv("WIKI_DIGEST_PERIOD", "weekly").lower()
+if PERIOD not in PERIOD_DAYS:
+    logger.warning(f"Unknown WIKI_DIGEST_PERIOD {PERIOD!r}, using weekly")
+    PERIOD = "weekly"
+STATE_KEY = "digest:window"
+# A period is posted once the feed has polled this long past its end, which
+# allows for the wiki's clock running behind ours.
+SETTLE_SECONDS = 60
+
+# Editors and pages are counted with Space-Saving, which keeps this many
+# counters however many distinct names a period sees.
+TOP_CAPACITY = 50
+TOP_SHOWN = 5
+NEW_PAGES_KEPT = 20
+NEW_PAGES_SHOWN = 10
+
+
+def period_start(ts: float) -> float:
+    """Start (00:00 UTC, Monday for weekly digests) of the period holding ``ts``."""
+    day = datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    if PERIOD == "weekly":
+        day -= datetime.timedelta(days=day.weekday())
+    return day.timestamp()
+
+
+def change_time(change: dict) -> float:
+    return discord.utils.parse_time(change["timestamp"]).timestamp()
+
+
+def page_link(title: str) -> str:
+    return f"[{title}](<{feedpoller.WIKI_BASE}/wiki/{title.replace(' ', '_')}>)"
+
+
+class SpaceSaving:
+    """Approximate top-k counter using at most ``capacity`` counters.
+
+    An unseen item replaces the current minimum and inherits its count,
+    so counts may overestimate by up to the recorded error; any item with
+    more than 1/capacity of all hits is guaranteed to be tracked.
+    """
+
+    def __init__(self, capacity: int, counts: dict[str, list[int]] | None = None):
+        self.capacity = capacity
+        # item -> [count, error]
+        self.counts: dict[str, list[int]] = counts or {}
+
+    def add(self, item: str) -> None:
+        entry = self.counts.get(item)
+        if entry is not None:
+            entry[0] += 1
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[item] = [1, 0]
+            return
+        victim = min(self.counts, key=lambda k: self.counts[k][0])
+        floor = self.counts.pop(victim)[0]
+        self.counts[item] = [floor + 1, floor]
+
+    def top(self, n: int) -> list[tuple[str, int]]:
+        ranked = sorted(self.counts.items(), key=lambda i: i[1][0], reverse=True)
+        return [(item, count) for item, (count, _) in ranked[:n]]
+
+
+class Window:
+    """Running totals for one digest period, in constant memory."""
+
+    def __init__(self, start: float):
+        self.start = start
+        self.edits = 0
+        self.added = 0
+        self.removed = 0
+        self.new_pages = 0
+        self.new_titles: deque[str] = deque(maxlen=NEW_PAGES_KEPT)
+        self.editors = SpaceSaving(TOP_CAPACITY)
+        self.pages = SpaceSaving(TOP_CAPACITY)
+
+    @property
+    def end(self) -> float:
+        return self.start + PERIOD_DAYS[PERIOD] * 86400
+
+    def add(self, change: dict) -> None:
+        kind = change.get("type")
+        if kind not in ("edit", "new"):
+            return
+        self.edits += 1
+        delta = change.get("newlen", 0) - change.get("oldlen", 0)
+        if delta > 0:
+            self.added += delta
+        else:
+            self.removed -= delta
+        self.editors.add(change.get("user", "?"))
+        self.pages.add(change["title"])
+        if kind == "new":
+            self.new_pages += 1
+            self.new_titles.append(change["title"])
+
+    def to_dict(self) -> dict:
+        return {
+            "start": self.start,
+            "edits": self.edits,
+            "added": self.added,
+            "removed": self.removed,
+            "new_pages": self.new_pages,
+            "new_titles": list(self.new_titles),
+            "editors": self.editors.counts,
+            "pages": self.pages.counts,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Window":
+        window = cls(data["start"])
+        window.edits = data["edits"]
+        window.added = data["added"]
+        window.removed = data["removed"]
+        window.new_pages = data["new_pages"]
+        window.new_titles.extend(data["new_titles"])
+        window.editors = SpaceSaving(TOP_CAPACITY, data["editors"])
+        window.pages = SpaceSaving(TOP_CAPACITY, data["pages"])
+        return window
+
+    def embed(self, final: bool) -> discord.Embed:
+        utc = datetime.timezone.utc
+        first = datetime.datetime.fromtimestamp(self.start, utc)
+        # The period end is exclusive; name the last day it covers.
+        last = datetime.datetime.fromtimestamp(min(self.end, time.time()) - 1, utc)
+        title = "Wiki digest" if final else "Wiki activity so far"
+        if first.date() != last.date():
+            title += f": {first:%b %d} – {last:%b %d, %Y}"
+        else:
+            title += f": {first:%b %d, %Y}"
+        embed = discord.Embed(
+            title=title,
+            url=f"{feedpoller.WIKI_BASE}/wiki/Special:RecentChanges",
+            color=discord.Color.purple(),
+        )
+        embed.add_field(
+            name="Activity",
+            value=f"{self.edits} edits, {self.new_pages} new pages\n"
+            f"+{self.added:,} / −{self.removed:,} bytes",
+            inline=False,
+        )
+        if editors := self.editors.top(TOP_SHOWN):
+            embed.add_field(
+                name="Top editors",
+                value="\n".join(f"{name} ({count})" for name, count in editors),
+                inline=True,
+            )
+        if pages := self.pages.top(TOP_SHOWN):
+            embed.add_field(
+                name="Most edited",
+                value="\n".join(f"{page_link(t)} ({count})" for t, count in pages),
+                inline=True,
+            )
+        if self.new_titles:
+            shown = list(self.new_titles)[-NEW_PAGES_SHOWN:]
+            value = "\n".join(page_link(t) for t in reversed(shown))
+            if self.new_pages > len(shown):
+                value += f"\n…and {self.new_pages - len(shown)} more"
+            embed.add_field(name="New pages", value=value[:1024], inline=False)
+        return embed
+
+
+class Digest(commands.Cog):
+    """Wiki activity digest aggregated from the recent-changes feed."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.window = Window(period_start(time.time()))
+        self.term = 0
+
+    async def cog_load(self):
+        await storage.state_store.load()
+        self.load()
+        if CHANNEL_ID:
+            # The digest needs the configured wiki polled even if no channel
+            # follows its feed.
+            feedpoller.watch("fandom", feedpoller.WIKI_BASE, "digest")
+
+    async def cog_unload(self):
+        feedpoller.unwatch("fandom", feedpoller.WIKI_BASE, "digest")
+        # Not saved here: on a standby the window is stale and would
+        # overwrite the leader's.
+        await storage.state_store.flush()
+
+    def load(self) -> None:
+        data = storage.state_store.get(STATE_KEY)
+        if data:
+            self.window = Window.from_dict(data)
+
+    def save(self) -> None:
+        storage.state_store.set(STATE_KEY, self.window.to_dict())
+
+    def sync_term(self) -> None:
+        # Another process may have aggregated (and saved) changes while
+        # this one was not leader.
+        leader = self.bot.leader  # type: ignore
+        if self.term != leader.term:
+            self.term = leader.term
+            self.load()
+
+    @commands.Cog.listener()
+    async def on_wiki_changes(self, base: str, changes: list[dict]):
+        if base != feedpoller.WIKI_BASE:
+            return
+        self.sync_term()
+        finished = []
+        # Changes arrive oldest first, so one past the window's end means the
+        # window has all of its changes.
+        for change in changes:
+            at = change_time(change)
+            if at < self.window.start:
+                logger.debug("Skipping change %s: period posted", change.get("rcid"))
+                continue
+            if at >= self.window.end:
+                finished.append(self.roll(at))
+            self.window.add(change)
+        self.save()
+        for window in finished:
+            await self.send(window)
+
+    @commands.Cog.listener()
+    async def on_wiki_caught_up(self, base: str, as_of: float):
+        """Post a quiet period once the feed has polled past its end."""
+        if base != feedpoller.WIKI_BASE:
+            return
+        self.sync_term()
+        if as_of < self.window.end + SETTLE_SECONDS:
+            return
+        finished = self.roll(as_of)
+        self.save()
+        await self.send(finished)
+
+    def roll(self, at: float) -> Window:
+        """Start the period holding ``at``; returns the finished window."""
+        finished, self.window = self.window, Window(period_start(at))
+        return finished
+
+    async def send(self, window: Window) -> None:
+        if not window.edits or not CHANNEL_ID:
+            return
+        channel = await self.bot.get_or_fetch_channel(CHANNEL_ID)  # type: ignore
+        if channel is None:
+            logger.error(f"Digest channel {CHANNEL_ID} not found")
+            return
+        try:
+            await self.bot.outbound.send_message(  # type: ignore
+                channel, embed=window.embed(final=True), priority=dispatcher.NORMAL
+            )
+        except discord.HTTPException as e:
+            logger.error(f"Failed to post the wiki digest: {e}")
+
+    @app_commands.command(name="digest", description="Wiki activity this period")
+    async def digest(self, interaction: discord.Interaction):
+        if not self.bot.leader.is_leader:  # type: ignore
+            # Only the leader aggregates; read what it last saved.
+            await storage.state_store.refresh()
+            self.load()
+        window = self.window
+        if window.end <= time.time():
+            window = Window(period_start(time.time()))
+        await interaction.response.send_message(embed=window.embed(final=False))
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Digest(bot))
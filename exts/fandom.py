@@ -1,20 +1,66 @@
+import asyncio
+import difflib
+import itertools
 import os
-import aiohttp
+import time
+import urllib.parse
 import discord
+from discord import app_commands
 from discord.ext import commands, tasks
+import feedpoller
+import httpclient
+import metrics
 import mylogger
+import profiler
 import re
+import scheduler
+import storage
 import utils
+import wikiindex
 
 logger = mylogger.getLogger(__name__)
 
-API_ENDPOINT = "https://welcometothenhk.fandom.com/api.php"
-WIKI_BASE = "https://welcometothenhk.fandom.com"
+WIKI_BASE = feedpoller.WIKI_BASE
+API_ENDPOINT = f"{WIKI_BASE}/api.php"
+WIKI_HOST = urllib.parse.urlsplit(WIKI_BASE).hostname
 WIKI_USER_AGENT = "WelcomeToTheNHK_DiscordBot/1.0 (Contact: ephemeral8997)"
-POLL_INTERVAL_SECONDS = 15
-
+POLL_MIN_SECONDS = float(os.getenv("WIKI_RC_POLL_MIN", "10"))
+POLL_MAX_SECONDS = float(os.getenv("WIKI_RC_POLL_MAX", "300"))
+RC_BATCH_LIMIT = 100
+RC_MAX_PAGES = 5
+REQUEST_TIMEOUT = 10
+
+# MediaWiki accepts up to 50 titles per query for regular accounts.
+RESOLVE_MAX_TITLES = 50
+RESOLVE_BATCH_DELAY = 0.05
+RESOLVE_CACHE_SIZE = 2048
+RESOLVE_CACHE_TTL = 3600
+RESOLVE_NEGATIVE_TTL = 300
+
+# Resolver answer for a title that could not be checked and is not cached.
+UNKNOWN = object()
+
+# Edit embeds carry an inline diff excerpt. Revisions are fetched in batches
+# and enrichment is abandoned after DIFF_BUDGET seconds (0 disables it).
+DIFF_BUDGET = float(os.getenv("WIKI_RC_DIFF_BUDGET", "2"))
+DIFF_MAX_REVISIONS = 50
+DIFF_MAX_CHARS = 500
+DIFF_MAX_LINE = 160
+DIFF_CACHE_SIZE = 512
+DIFF_CACHE_TTL = 3600
+
+INDEX_FILE = os.getenv("WIKI_INDEX_FILE", "wiki_index.json.gz")
+INDEX_MAX_AGE = int(os.getenv("WIKI_INDEX_MAX_AGE", str(7 * 24 * 3600)))
+# The leader saves new titles this often; standbys check for a newer file
+# every INDEX_SYNC_SECONDS (every INDEX_WAIT_SECONDS until they have one).
+INDEX_SAVE_INTERVAL = 60
+INDEX_SYNC_SECONDS = 60
+INDEX_WAIT_SECONDS = 1
+
+# Where the configured wiki's feed is posted on first start.
 CHANNEL_ID = int(os.getenv("WIKI_RC_CHANNEL_ID", "0"))
 WEBHOOK_NAME = os.getenv("WIKI_RC_WEBHOOK_NAME", "f/WelcomeToTheNHK")
+CURSOR_KEY = "fandom:cursor"
 
 HIDE_MINOR = os.getenv("WIKI_RC_HIDE_MINOR", "false").lower() in ("1", "true", "yes")
 
@@ -24,81 +70,539 @@ IGNORE_PAGES = {
     if t.strip()
 }
 
+class PageResolver:
+    """Resolve wiki titles to canonical pages in coalesced, cached batches."""
 
-class Fandom(commands.Cog):
-    def __init__(self, bot: commands.Bot):
-        self.bot = bot
-        self.last_rcid = None
-        self.session_manager = utils.SessionManager()
-        self.poll_changes.start()
+    def __init__(self, http: httpclient.HTTPClient):
+        self.http = http
+        self.cache = utils.TTLCache(
+            RESOLVE_CACHE_SIZE, RESOLVE_CACHE_TTL, name="wiki-titles"
+        )
+        self._pending: dict[str, asyncio.Future] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    async def resolve_many(self, titles: list[str]) -> dict[str, object]:
+        """Map each title to its canonical page title, or None if missing.
+
+        While the wiki cannot be reached, titles resolve to their last known
+        (possibly expired) answer, or to :data:`UNKNOWN`.
+        """
+        results: dict[str, object] = {}
+        waiting: dict[str, asyncio.Future] = {}
+        loop = asyncio.get_running_loop()
+
+        for title in titles:
+            key = wikiindex.normalize_title(title)
+            cached = self.cache.get(key, utils.MISSING)
+            if cached is not utils.MISSING:
+                results[title] = cached
+                continue
+            future = self._pending.get(key)
+            if future is None:
+                future = loop.create_future()
+                self._pending[key] = future
+            waiting[title] = future
+
+        if waiting:
+            if len(self._pending) >= RESOLVE_MAX_TITLES:
+                self._schedule_flush(0)
+            elif self._flush_task is None:
+                self._schedule_flush(RESOLVE_BATCH_DELAY)
+
+        for title, future in waiting.items():
+            results[title] = await asyncio.shield(future)
+        return results
+
+    async def resolve(self, title: str) -> object:
+        return (await self.resolve_many([title]))[title]
+
+    def _schedule_flush(self, delay: float) -> None:
+        if self._flush_task is not None and delay:
+            return
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        self._flush_task = asyncio.create_task(self._flush(delay))
+
+    async def _flush(self, delay: float) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+        self._flush_task = None
+        pending, self._pending = self._pending, {}
+
+        keys = list(pending)
+        chunks = [
+            keys[i : i + RESOLVE_MAX_TITLES]
+            for i in range(0, len(keys), RESOLVE_MAX_TITLES)
+        ]
+        await asyncio.gather(*(self._query(chunk, pending) for chunk in chunks))
+
+    async def _query(self, keys: list[str], pending: dict[str, asyncio.Future]):
+        params = {
+            "action": "query",
+            "titles": "|".join(keys),
+            "redirects": "1",
+            "format": "json",
+        }
 
-    async def cog_unload(self):
-        self.poll_changes.cancel()
-        await self.session_manager.close()
+        resolved: dict[str, str | None] | None = None
+        try:
+            response = await self.http.get(API_ENDPOINT, params=params)
+            if response.status == 200:
+                resolved = self._parse(keys, response.json())
+        except httpclient.CircuitOpenError as e:
+            logger.debug("Not resolving %d wiki titles: %s", len(keys), e)
+        except Exception as e:
+            logger.warning(f"Failed to resolve {len(keys)} wiki titles: {e}")
+
+        for key in keys:
+            future = pending[key]
+            if resolved is None:
+                # Failures are not cached so the next mention retries; until
+                # then answer from the expired entry if there is one.
+                future.set_result(self.cache.get(key, UNKNOWN, stale=True))
+                continue
+            canonical = resolved.get(key)
+            ttl = RESOLVE_CACHE_TTL if canonical else RESOLVE_NEGATIVE_TTL
+            self.cache.set(key, canonical, ttl)
+            if canonical:
+                self.cache.set(wikiindex.normalize_title(canonical), canonical)
+            future.set_result(canonical)
+
+    @staticmethod
+    def _parse(keys: list[str], data: dict) -> dict[str, str | None]:
+        query = data.get("query", {})
+        normalized = {n["from"]: n["to"] for n in query.get("normalized", [])}
+        redirects = {r["from"]: r["to"] for r in query.get("redirects", [])}
+        existing = {
+            page["title"]
+            for page in query.get("pages", {}).values()
+            if "missing" not in page and "invalid" not in page
+        }
 
-    @tasks.loop(seconds=POLL_INTERVAL_SECONDS)
-    async def poll_changes(self):
-        if CHANNEL_ID == 0:
-            return
+        resolved = {}
+        for key in keys:
+            title = normalized.get(key, key)
+            seen = set()
+            while title in redirects and title not in seen:
+                seen.add(title)
+                title = redirects[title]
+            resolved[key] = title if title in existing else None
+        return resolved
 
-        channel = self.bot.get_channel(CHANNEL_ID)
-        if channel is None:
-            return
 
+class Wiki:
+    """Recent-changes cursor for one subscribed wiki."""
+
+    def __init__(self, base: str):
+        self.base = base
+        self.api = f"{base}/api.php"
+        self.host = urllib.parse.urlsplit(base).hostname
+        self.last_rcid = None
+        self.last_timestamp = None
+        # Whether the last fetch reached the newest change, rather than
+        # stopping at RC_MAX_PAGES or on an error.
+        self.caught_up = False
+        # The configured wiki keeps the cursor key it had before feeds
+        # could follow more than one wiki.
+        self.cursor_key = CURSOR_KEY if base == WIKI_BASE else f"{CURSOR_KEY}:{base}"
+
+
+def diff_excerpt(old: str, new: str) -> str:
+    """The changed lines between two revisions, trimmed to fit an embed."""
+    diff = difflib.unified_diff(
+        old.splitlines(), new.splitlines(), n=0, lineterm=""
+    )
+    lines = []
+    size = 0
+    # Skip the ---/+++ file header.
+    for line in itertools.islice(diff, 2, None):
+        if line.startswith("@@"):
+            continue
+        if len(line) > DIFF_MAX_LINE:
+            line = line[: DIFF_MAX_LINE - 1] + "…"
+        if size + len(line) > DIFF_MAX_CHARS:
+            lines.append("…")
+            break
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines).replace("```", "`\u200b``")
+
+
+class DiffFetcher:
+    """Diff excerpts for edits, fetched in batches and cached by revid."""
+
+    def __init__(self, http: httpclient.HTTPClient):
+        self.http = http
+        self.cache = utils.TTLCache(DIFF_CACHE_SIZE, DIFF_CACHE_TTL, name="wiki-diffs")
+
+    async def excerpts(self, wiki: Wiki, changes: list[dict]) -> dict[int, str]:
+        """Map the revid of each change to its excerpt, skipping failures."""
+        results: dict[int, str] = {}
+        parents: dict[int, int] = {}
+        for change in changes:
+            revid = change.get("revid")
+            if not revid:
+                continue
+            cached = self.cache.get((wiki.base, revid))
+            if cached is not None:
+                results[revid] = cached
+            else:
+                parents[revid] = change.get("old_revid") or 0
+        if not parents:
+            return results
+
+        revids = sorted({r for pair in parents.items() for r in pair if r})
+        chunks = [
+            revids[i : i + DIFF_MAX_REVISIONS]
+            for i in range(0, len(revids), DIFF_MAX_REVISIONS)
+        ]
+        contents: dict[int, str] = {}
+        for batch in await asyncio.gather(*(self._fetch(wiki, c) for c in chunks)):
+            contents.update(batch)
+
+        # difflib is pure Python and slow on long pages.
+        excerpts = await asyncio.to_thread(self._diff_all, parents, contents)
+        for revid, excerpt in excerpts.items():
+            self.cache.set((wiki.base, revid), excerpt)
+        results.update(excerpts)
+        return results
+
+    async def _fetch(self, wiki: Wiki, revids: list[int]) -> dict[int, str]:
         params = {
             "action": "query",
-            "list": "recentchanges",
-            "rcprop": "ids|title|user|comment|timestamp|sizes|flags",
-            "rclimit": "1",
+            "prop": "revisions",
+            "revids": "|".join(map(str, revids)),
+            "rvprop": "ids|content",
+            "rvslots": "main",
             "format": "json",
         }
+        try:
+            resp = await self.http.get(
+                wiki.api, params=params, slots=scheduler.fetch_slots
+            )
+            resp.raise_for_status()
+            data = resp.json()
+        except httpclient.CircuitOpenError as e:
+            logger.debug("Not fetching %d revisions: %s", len(revids), e)
+            return {}
+        except Exception as e:
+            logger.warning(f"Failed to fetch {len(revids)} revisions: {e}")
+            return {}
+
+        contents = {}
+        for page in data.get("query", {}).get("pages", {}).values():
+            for rev in page.get("revisions", []):
+                main = rev.get("slots", {}).get("main", {})
+                content = main.get("*", main.get("content"))
+                if content is not None:
+                    contents[rev["revid"]] = content
+        return contents
+
+    @staticmethod
+    def _diff_all(parents: dict[int, int], contents: dict[int, str]) -> dict[int, str]:
+        excerpts = {}
+        for revid, parent in parents.items():
+            if revid not in contents or (parent and parent not in contents):
+                continue
+            old = contents[parent] if parent else ""
+            excerpts[revid] = diff_excerpt(old, contents[revid])
+        return excerpts
+
+
+class Fandom(feedpoller.FeedPoller):
+    kind = "fandom"
 
-        headers = {"User-Agent": WIKI_USER_AGENT}
+    def __init__(self, bot: commands.Bot):
+        super().__init__(bot)
+        self.wikis: dict[str, Wiki] = {}
+        self.refused: set[str] = set()
+        self.http = bot.http_client  # type: ignore
+        self.http.configure_host(
+            WIKI_HOST,
+            rate=5,
+            burst=10,
+            headers={"User-Agent": WIKI_USER_AGENT},
+            timeout=REQUEST_TIMEOUT,
+        )
+        self.resolver = PageResolver(self.http)
+        self.diffs = DiffFetcher(self.http)
+        self.index = wikiindex.TitleIndex(utils.data_path(INDEX_FILE))
+        self._index_task: asyncio.Task | None = None
+        self._index_saved_at = time.monotonic()
+        self.interval = scheduler.register(
+            "fandom", POLL_MIN_SECONDS, POLL_MAX_SECONDS
+        )
+        self.poll_changes.start()
 
+    async def cog_load(self):
+        await storage.state_store.load()
+        await storage.subscriptions.load()
+        await self.seed_subscription(
+            WIKI_BASE,
+            CHANNEL_ID,
+            WEBHOOK_NAME,
+            {"hide_minor": HIDE_MINOR, "ignore_pages": sorted(IGNORE_PAGES)},
+        )
+        self.sync_index.start()
+
+    async def cog_unload(self):
+        self.poll_changes.cancel()
+        self.sync_index.cancel()
+        if self._index_task:
+            self._index_task.cancel()
+        # Standbys only ever hold what the leader saved.
+        leading = self.bot.leader.is_leader  # type: ignore
+        if leading and self.index.ready and self.index.dirty:
+            await self.index.save()
+        await storage.state_store.flush()
+
+    def get_wiki(self, base: str) -> Wiki:
+        wiki = self.wikis.get(base)
+        if wiki is None:
+            wiki = self.wikis[base] = Wiki(base)
+            if wiki.host != WIKI_HOST:
+                self.http.configure_host(
+                    wiki.host,  # type: ignore
+                    rate=5,
+                    burst=10,
+                    headers={"User-Agent": WIKI_USER_AGENT},
+                    timeout=REQUEST_TIMEOUT,
+                )
+            cursor = storage.state_store.get(wiki.cursor_key)
+            if cursor:
+                wiki.last_rcid = cursor["rcid"]
+                wiki.last_timestamp = cursor["timestamp"]
+                logger.info(
+                    f"Resuming {base} recent changes after rcid {wiki.last_rcid}"
+                )
+        return wiki
+
+    async def build_index(self):
         try:
-            session = await self.session_manager.get_session()
-            async with session.get(
-                API_ENDPOINT, params=params, headers=headers
-            ) as resp:
-                if resp.status != 200:
-                    return
-                data = await resp.json()
-        except Exception:
-            return
+            await self.index.bootstrap(self.http, API_ENDPOINT)
+            self._index_saved_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Failed to build wiki index: {e}")
+        finally:
+            self._index_task = None
+
+    @tasks.loop(seconds=INDEX_WAIT_SECONDS)
+    @profiler.timed
+    async def sync_index(self):
+        """Keep the title index in step with the copy on disk.
+
+        Only the leader sees recent changes, so standbys reload the file
+        whenever the leader saves it. Only the leader crawls the wiki, when
+        there is no index yet or it is older than INDEX_MAX_AGE.
+        """
+        if not self.index.dirty and self.index.changed_on_disk():
+            await self.index.load()
+
+        leading = self.bot.leader.is_leader  # type: ignore
+        stale = time.time() - self.index.built_at >= INDEX_MAX_AGE
+        if leading and (not self.index.ready or stale) and self._index_task is None:
+            if self.index.ready:
+                logger.info("Wiki index is stale, rebuilding")
+            # Crawling can take minutes; this loop keeps its schedule.
+            self._index_task = asyncio.create_task(self.build_index())
+
+        waiting = not self.index.ready and not leading
+        self.sync_index.change_interval(
+            seconds=INDEX_WAIT_SECONDS if waiting else INDEX_SYNC_SECONDS
+        )
 
-        changes = data.get("query", {}).get("recentchanges", [])
-        if not changes:
+    @tasks.loop(seconds=POLL_MIN_SECONDS)
+    @profiler.timed
+    async def poll_changes(self):
+        if not self.leading():
+            self.poll_changes.change_interval(seconds=self.interval.floor)
             return
+        activity = await self.poll_once()
+        self.poll_changes.change_interval(seconds=self.interval.record(activity))
+
+    def reset(self) -> None:
+        self.wikis.clear()
+
+    def sources(self) -> dict[str, list[storage.Subscription]]:
+        sources = super().sources()
+        for base in [b for b in sources if not feedpoller.wiki_allowed(b)]:
+            # Subscribed before the wiki was disallowed.
+            del sources[base]
+            if base not in self.refused:
+                self.refused.add(base)
+                logger.warning(f"Not polling {base}: not an allowed feed wiki")
+        return sources
+
+    async def poll_source(self, source: str, subs: list[storage.Subscription]) -> bool:
+        """Fetch one wiki's changes once and post them to every subscriber."""
+        wiki = self.get_wiki(source)
+        started = time.time()
+        changes = await self.fetch_changes(wiki)
+        if changes is None:
+            metrics.FEED_POLLS.labels("fandom", "error").inc()
+            return False
+        activity = await self.post_changes(wiki, changes, subs)
+        if wiki.caught_up:
+            # Every change made before this poll started has been dispatched.
+            self.bot.dispatch("wiki_caught_up", wiki.base, started)
+        return activity
+
+    async def post_changes(
+        self, wiki: Wiki, changes: list[dict], subs: list[storage.Subscription]
+    ) -> bool:
+        """Post the changes past the cursor; True if there were any."""
+        if not changes:
+            metrics.FEED_POLLS.labels("fandom", "none").inc()
+            return False
 
-        change = changes[0]
-        is_minor = "minor" in change
+        newest = changes[-1]
 
-        if HIDE_MINOR and is_minor:
-            return
+        if wiki.last_rcid is None:
+            self.save_cursor(wiki, newest)
+            return False
 
-        if change["title"].replace("_", " ").title() in IGNORE_PAGES:
-            logger.debug(
-                "Ignored edit to %s (in WIKI_RC_IGNORE_PAGES)", change["title"]
+        changes = [c for c in changes if c["rcid"] > wiki.last_rcid]
+        if not changes:
+            metrics.FEED_POLLS.labels("fandom", "none").inc()
+            return False
+
+        self.save_cursor(wiki, newest)
+        self.bot.dispatch("wiki_changes", wiki.base, changes)
+
+        if wiki.base == WIKI_BASE and self.index.ready:
+            for change in changes:
+                self.index.apply_change(change)
+            if (
+                self.index.dirty
+                and time.monotonic() - self._index_saved_at > INDEX_SAVE_INTERVAL
+            ):
+                self._index_saved_at = time.monotonic()
+                await self.index.save()
+
+        wanted = [
+            c for c in changes if any(self.should_post(c, s.filters) for s in subs)
+        ]
+        diffs = await self.fetch_diffs(wiki, wanted)
+        items = []
+        for change in wanted:
+            embed = self.build_embed(wiki, change, diffs.get(change.get("revid")))
+            created = embed.timestamp.timestamp() if embed.timestamp else None
+            items.append(
+                feedpoller.FeedItem(f"rcid:{change['rcid']}", change, embed, created)
             )
-            return
-
-        current_rcid = change["rcid"]
+        await self.fan_out(subs, items)
+        return True
 
-        if self.last_rcid is None:
-            self.last_rcid = current_rcid
-            return
-
-        if current_rcid <= self.last_rcid:
-            return
+    async def fetch_diffs(self, wiki: Wiki, changes: list[dict]) -> dict[int, str]:
+        """Diff excerpts keyed by revid; none if not ready within DIFF_BUDGET."""
+        if DIFF_BUDGET <= 0 or not changes:
+            return {}
+        try:
+            return await asyncio.wait_for(
+                self.diffs.excerpts(wiki, changes), DIFF_BUDGET
+            )
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Diffs for {wiki.base} took over {DIFF_BUDGET:g}s, posting without"
+            )
+        except Exception as e:
+            logger.error(f"Failed to build diffs for {wiki.base}: {e}")
+        return {}
+
+    def save_cursor(self, wiki: Wiki, change: dict) -> None:
+        wiki.last_rcid = change["rcid"]
+        wiki.last_timestamp = change["timestamp"]
+        storage.state_store.set(
+            wiki.cursor_key,
+            {"rcid": wiki.last_rcid, "timestamp": wiki.last_timestamp},
+        )
 
-        self.last_rcid = current_rcid
+    async def fetch_changes(self, wiki: Wiki) -> list[dict] | None:
+        """Fetch changes from the cursor onwards, oldest first.
 
+        Pages forward from the cursor's timestamp, so after a burst or a
+        downtime the oldest missed changes come first and whatever does not
+        fit in RC_MAX_PAGES is picked up by the next poll. Without a cursor
+        only the newest change is fetched. Returns None if a request fails
+        before any new change was fetched.
+        """
+        params = {
+            "action": "query",
+            "list": "recentchanges",
+            "rcprop": "ids|title|user|comment|timestamp|sizes|flags|loginfo",
+            "rclimit": "1" if wiki.last_rcid is None else str(RC_BATCH_LIMIT),
+            "format": "json",
+        }
+        if wiki.last_rcid is not None and wiki.last_timestamp:
+            params["rcdir"] = "newer"
+            params["rcstart"] = wiki.last_timestamp
+
+        wiki.caught_up = False
+        changes = []
+        pages = 0
+        while True:
+            try:
+                resp = await self.http.get(
+                    wiki.api, params=params, slots=scheduler.fetch_slots
+                )
+                resp.raise_for_status()
+                data = resp.json()
+            except httpclient.CircuitOpenError as e:
+                logger.debug("Skipping %s recent changes: %s", wiki.base, e)
+                return changes if changes else None
+            except Exception as e:
+                logger.warning(f"Failed to fetch recent changes from {wiki.base}: {e}")
+                return changes if changes else None
+
+            batch = data.get("query", {}).get("recentchanges", [])
+            if wiki.last_rcid is None:
+                changes.extend(batch)
+                wiki.caught_up = True
+                break
+
+            # rcstart is inclusive and has one-second resolution, so pages of
+            # changes already seen are skipped without counting against
+            # RC_MAX_PAGES.
+            batch = [c for c in batch if c["rcid"] > wiki.last_rcid]
+            if batch:
+                changes.extend(batch)
+                pages += 1
+
+            cont = data.get("continue", {}).get("rccontinue")
+            if not cont:
+                wiki.caught_up = True
+                break
+            if pages == RC_MAX_PAGES:
+                logger.info(
+                    f"Catching up on {wiki.base}: {len(changes)} changes fetched, "
+                    "the rest follow on the next poll"
+                )
+                break
+            params["rccontinue"] = cont
+
+        changes.sort(key=lambda c: c["rcid"])
+        return changes
+
+    def should_post(self, change: dict, filters: dict) -> bool:
+        if filters.get("hide_minor") and "minor" in change:
+            return False
+
+        ignored = filters.get("ignore_pages")
+        if ignored and change["title"].replace("_", " ").title() in ignored:
+            logger.debug("Ignored edit to %s (in ignore_pages)", change["title"])
+            return False
+
+        return True
+
+    def build_embed(
+        self, wiki: Wiki, change: dict, diff: str | None = None
+    ) -> discord.Embed:
         revid = change.get("revid")
         old_revid = change.get("old_revid")
         if old_revid:
-            diff_url = f"{WIKI_BASE}/wiki/Special:Diff/{revid}/{old_revid}"
+            diff_url = f"{wiki.base}/wiki/Special:Diff/{revid}/{old_revid}"
         else:
-            diff_url = f"{WIKI_BASE}/wiki/Special:Diff/{revid}"
+            diff_url = f"{wiki.base}/wiki/Special:Diff/{revid}"
 
         size_diff = ""
         if "oldlen" in change and "newlen" in change:
@@ -111,7 +615,7 @@ class Fandom(commands.Cog):
             color = discord.Color.red()
         elif "new" in change:
             color = discord.Color.green()
-        elif is_minor:
+        elif "minor" in change:
             color = discord.Color.gold()
 
         embed = discord.Embed(
@@ -125,31 +629,15 @@ class Fandom(commands.Cog):
         if size_diff:
             embed.add_field(name="Size Change", value=size_diff, inline=True)
         embed.add_field(name="Revision ID", value=str(revid), inline=True)
-        embed.set_footer(text=f"rcid:{current_rcid}")
-
-        webhook = await utils.WebhookHelper.get_or_create_webhook(channel, WEBHOOK_NAME)  # type: ignore
-        await webhook.send(embed=embed)
+        if diff:
+            embed.add_field(name="Diff", value=f"```diff\n{diff}\n```", inline=False)
+        embed.set_footer(text=f"rcid:{change['rcid']}")
+        return embed
 
     @poll_changes.before_loop
     async def before_fetch(self):
         await self.bot.wait_until_ready()
 
-    async def page_exists(self, page_title: str) -> bool:
-        """Check if a wiki page exists using the MediaWiki API."""
-        params = {"action": "query", "titles": page_title, "format": "json"}
-
-        try:
-            session = await self.session_manager.get_session()
-            async with session.get(API_ENDPOINT, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    pages = data.get("query", {}).get("pages", {})
-                    return "-1" not in pages
-        except Exception:
-            pass
-
-        return False
-
     def extract_references(self, content: str) -> list[str]:
         """Extract all [[...]] references from message content."""
         pattern = r"\[\[([^\[\]]+)\]\]"
@@ -177,16 +665,64 @@ class Fandom(commands.Cog):
         if not references:
             return
 
+        resolved = {
+            ref: self.index.lookup(ref) for ref in references if self.index.covers(ref)
+        }
+        remote = [ref for ref in references if ref not in resolved]
+        if remote:
+            resolved.update(await self.resolver.resolve_many(remote))
+
         valid_links = []
         for ref in references:
-            formatted_title = self.format_page_title(ref)
-            if await self.page_exists(formatted_title):
-                url = f"{WIKI_BASE}/wiki/{formatted_title}"
+            canonical = resolved.get(ref)
+            if canonical is UNKNOWN:
+                # The wiki is unreachable; link the title as written.
+                url = f"{WIKI_BASE}/wiki/{self.format_page_title(ref)}"
+                valid_links.append(f"• **{ref}**: <{url}> (unverified)")
+            elif isinstance(canonical, str):
+                url = f"{WIKI_BASE}/wiki/{self.format_page_title(canonical)}"
                 valid_links.append(f"• **{ref}**: <{url}>")
 
         if valid_links:
             response = "**Wiki Pages Found:**\n" + "\n".join(valid_links)
-            await message.reply(response, mention_author=False)
+            await self.bot.outbound.send_message(  # type: ignore
+                message.channel,
+                content=response,
+                reference=message,
+                mention_author=False,
+            )
+
+    @app_commands.command(name="wiki", description="Link a page on the wiki")
+    @app_commands.describe(page="Title of the wiki page")
+    async def wiki(self, interaction: discord.Interaction, page: str):
+        if self.index.covers(page):
+            canonical = self.index.lookup(page)
+        else:
+            canonical = await self.resolver.resolve(page)
+
+        if canonical is UNKNOWN:
+            await interaction.response.send_message(
+                "The wiki can't be reached right now, try again later.",
+                ephemeral=True,
+            )
+            return
+        if not canonical:
+            await interaction.response.send_message(
+                f"No wiki page named **{page}**.", ephemeral=True
+            )
+            return
+
+        url = f"{WIKI_BASE}/wiki/{self.format_page_title(canonical)}"
+        await interaction.response.send_message(f"**{canonical}**: <{url}>")
+
+    @wiki.autocomplete("page")
+    async def wiki_autocomplete(
+        self, interaction: discord.Interaction, current: str
+    ) -> list[app_commands.Choice[str]]:
+        return [
+            app_commands.Choice(name=title[:100], value=title[:100])
+            for title in self.index.search(current)
+        ]
 
 
 async def setup(bot: commands.Bot):
@@ -0,0 +1,185 @@
+import re
+import typing
+import urllib.parse
+import discord
+from discord import app_commands
+from discord.ext import commands
+import feedpoller
+import mylogger
+import storage
+
+logger = mylogger.getLogger(__name__)
+
+LAZY = True
+
+SUBREDDIT_PATTERN = re.compile(r"(?:/?r/)?([A-Za-z0-9_]{2,21})/?")
+MAX_SUBSCRIPTIONS_PER_GUILD = 25
+
+
+def normalize_wiki(value: str) -> str | None:
+    """Base URL of a wiki given its URL, host name or Fandom subdomain."""
+    value = value.strip()
+    if "://" not in value:
+        value = "https://" + (value if "." in value else f"{value}.fandom.com")
+    parts = urllib.parse.urlsplit(value)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return None
+    return f"{parts.scheme}://{parts.netloc.lower()}"
+
+
+def wiki_source(value: str) -> str | None:
+    """Like :func:`normalize_wiki`, but only for wikis feeds may follow."""
+    base = normalize_wiki(value)
+    return base if base and feedpoller.wiki_allowed(base) else None
+
+
+def subreddit_source(value: str) -> str | None:
+    match = SUBREDDIT_PATTERN.fullmatch(value.strip())
+    return match[1] if match else None
+
+
+def split_list(value: str) -> list[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def default_webhook(kind: str, source: str) -> str:
+    if kind == "reddit":
+        return f"r/{source}"
+    host = urllib.parse.urlsplit(source).hostname or source
+    return f"f/{host.split('.')[0]}"
+
+
+def describe(sub: storage.Subscription) -> str:
+    source = f"r/{sub.source}" if sub.kind == "reddit" else f"<{sub.source}>"
+    filters = []
+    if sub.filters.get("hide_minor"):
+        filters.append("no minor edits")
+    if pages := sub.filters.get("ignore_pages"):
+        filters.append(f"ignoring {', '.join(pages)}")
+    if flairs := sub.filters.get("flairs"):
+        filters.append(f"flairs: {', '.join(flairs)}")
+    suffix = f" ({'; '.join(filters)})" if filters else ""
+    return f"{source} → <#{sub.channel_id}>{suffix}"
+
+
+@app_commands.guild_only()
+@app_commands.default_permissions(manage_webhooks=True)
+class Feeds(commands.GroupCog, group_name="feed", group_description="Manage feeds"):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    async def cog_load(self):
+        await storage.subscriptions.load()
+
+    @app_commands.command(description="Post a wiki's or subreddit's new items here")
+    @app_commands.describe(
+        source="Wiki URL or Fandom name, or subreddit name",
+        channel="Channel to post to",
+        hide_minor="Skip minor wiki edits",
+        ignore_pages="Comma-separated wiki pages to skip",
+        flairs="Comma-separated Reddit flairs to post (default: all)",
+    )
+    async def subscribe(
+        self,
+        interaction: discord.Interaction,
+        kind: typing.Literal["fandom", "reddit"],
+        source: str,
+        channel: discord.TextChannel,
+        hide_minor: bool = False,
+        ignore_pages: str = "",
+        flairs: str = "",
+    ):
+        if kind == "fandom":
+            normalized = wiki_source(source)
+            filters = {
+                "hide_minor": hide_minor,
+                "ignore_pages": sorted(
+                    {t.replace("_", " ").title() for t in split_list(ignore_pages)}
+                ),
+            }
+        else:
+            normalized = subreddit_source(source)
+            filters = {"flairs": sorted({f.casefold() for f in split_list(flairs)})}
+        if normalized is None:
+            if kind == "fandom":
+                domains = ", ".join(feedpoller.FEED_WIKI_DOMAINS)
+                message = f"**{source}** is not an https wiki on {domains}."
+            else:
+                message = f"**{source}** is not a valid {kind} source."
+            await interaction.response.send_message(message, ephemeral=True)
+            return
+
+        existing = storage.subscriptions.get(kind, normalized, channel.id)
+        in_guild = storage.subscriptions.for_channels(
+            c.id for c in interaction.guild.channels  # type: ignore
+        )
+        if existing is None and len(in_guild) >= MAX_SUBSCRIPTIONS_PER_GUILD:
+            await interaction.response.send_message(
+                f"This server already has {MAX_SUBSCRIPTIONS_PER_GUILD} feeds.",
+                ephemeral=True,
+            )
+            return
+
+        webhook = existing.webhook if existing else default_webhook(kind, normalized)
+
+        sub = await storage.subscriptions.add(
+            kind, normalized, channel.id, webhook, filters
+        )
+        logger.info(f"{interaction.user} subscribed #{channel} to {normalized}")
+        verb = "Updated" if existing else "Added"
+        await interaction.response.send_message(
+            f"{verb} {describe(sub)}", ephemeral=True
+        )
+
+    @app_commands.command(description="Stop posting a feed to a channel")
+    @app_commands.describe(
+        source="Wiki URL or Fandom name, or subreddit name",
+        channel="Channel the feed posts to",
+    )
+    async def unsubscribe(
+        self,
+        interaction: discord.Interaction,
+        kind: typing.Literal["fandom", "reddit"],
+        source: str,
+        channel: discord.TextChannel,
+    ):
+        # Not restricted to allowed wikis, so feeds made before a wiki was
+        # disallowed can still be removed.
+        normalized = (normalize_wiki if kind == "fandom" else subreddit_source)(source)
+        sub = normalized and storage.subscriptions.get(kind, normalized, channel.id)
+        if not sub:
+            await interaction.response.send_message(
+                f"{channel.mention} is not subscribed to **{source}**.", ephemeral=True
+            )
+            return
+
+        await storage.subscriptions.remove(sub)
+        logger.info(f"{interaction.user} unsubscribed #{channel} from {sub.source}")
+        await interaction.response.send_message(
+            f"Removed {describe(sub)}", ephemeral=True
+        )
+
+    @app_commands.command(name="list", description="Show this server's feeds")
+    async def list_feeds(self, interaction: discord.Interaction):
+        subs = storage.subscriptions.for_channels(
+            c.id for c in interaction.guild.channels  # type: ignore
+        )
+        if not subs:
+            await interaction.response.send_message(
+                "No feeds are set up in this server.", ephemeral=True
+            )
+            return
+        lines = sorted(f"• {describe(sub)}" for sub in subs)
+        await interaction.response.send_message(
+            "**Feeds:**\n" + "\n".join(lines), ephemeral=True
+        )
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        for sub in storage.subscriptions.for_channels([channel.id]):
+            await storage.subscriptions.remove(sub)
+            logger.info(f"Removed {sub.kind} {sub.source} feed for deleted #{channel}")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Feeds(bot))
@@ -1,86 +1,231 @@
+import asyncio
 import os
+import time
+from collections import deque
 import discord
 from discord.ext import commands
+import dispatcher
+import httpclient
+import metrics
 import mylogger
+import utils
 
 logger = mylogger.getLogger(__name__)
 
+# Role assignments share Discord's per-guild member route limit, so they go
+# through bounded per-guild queues drained by a few workers behind a
+# per-guild bucket. A guild is worked on by one worker at a time, so a raid
+# on one guild cannot hold up joins in the others.
+ROLE_WORKERS = 4
+ROLE_QUEUE_SIZE = 1000
+ROLE_RATE = float(os.getenv("JOIN_ROLE_RATE", "2"))
+ROLE_BURST = int(os.getenv("JOIN_ROLE_BURST", "5"))
+ROLE_MAX_ATTEMPTS = 3
+RATE_LIMIT_PAUSE = 5
+# Members who left are remembered this long, so queued work for them is
+# skipped without needing the member cache.
+DEPARTED_TTL = 900
+DEPARTED_MAX = 10000
+
+# Joins within this many seconds of a welcome share the next welcome message.
+WELCOME_COALESCE_SECONDS = float(os.getenv("WELCOME_COALESCE_SECONDS", "10"))
+WELCOME_MAX_MENTIONS = 40
+
+
+def parse_id(name: str) -> int | None:
+    value = os.getenv(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        logger.error(f"Invalid {name}: {value}")
+        return None
+
+
+def welcome_message(mentions: str, rules: str, announcements: str) -> str:
+    return (
+        f"# 📺 Welcome to the Community, {mentions}! 📺\n\n"
+        f"{rules}\n"
+        "_Breaking the contract will incur a **1,000,000 yen fee**._ 💸\n\n"
+        "-# 📢 Announcements\n"
+        f"{announcements}\n\n"
+        "-# ⚙️ Channels & Roles\n"
+        "Visit **Channels & Roles** above the channels to subscribe for more roles and unlock extra channels.\n\n"
+        "**Enjoy your stay!**"
+    )
+
 
 class OnMember(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.rules_channel_id = os.getenv("RULES_CHANNEL_ID")
-        self.announcements_channel_id = os.getenv("ANNOUNCEMENTS_CHANNEL_ID")
+        self.member_role_id = parse_id("MEMBER_ROLE_ID")
+        self.bot_role_id = parse_id("BOT_ROLE_ID")
+        self.welcome_channel_id = parse_id("WELCOME_CHANNEL_ID")
+        rules_channel_id = parse_id("RULES_CHANNEL_ID")
+        announcements_channel_id = parse_id("ANNOUNCEMENTS_CHANNEL_ID")
+        self.rules_mention = f"<#{rules_channel_id}>" if rules_channel_id else ""
+        self.announcements_mention = (
+            f"<#{announcements_channel_id}>" if announcements_channel_id else ""
+        )
+        if self.member_role_id is None:
+            logger.error("MEMBER_ROLE_ID not set in environment")
+
+        self.role_jobs: dict[int, deque[tuple]] = {}
+        # Guilds with queued jobs and no worker on them.
+        self.ready_guilds: asyncio.Queue[int] = asyncio.Queue()
+        self.role_slots = asyncio.Semaphore(ROLE_QUEUE_SIZE)
+        self.queued = 0
+        self.buckets: dict[int, httpclient.TokenBucket] = {}
+        self.workers: list[asyncio.Task] = []
+        self.pending_welcomes: list[discord.Member] = []
+        self.welcome_task: asyncio.Task | None = None
+        self.departed = utils.TTLCache(DEPARTED_MAX, DEPARTED_TTL, name="departed")
+
+    async def cog_load(self):
+        self.workers = [
+            asyncio.create_task(self.role_worker(), name=f"autorole-{i}")
+            for i in range(ROLE_WORKERS)
+        ]
+
+    async def cog_unload(self):
+        for task in self.workers:
+            task.cancel()
+        if self.welcome_task:
+            self.welcome_task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+    def has_left(self, member: discord.Member) -> bool:
+        return (member.guild.id, member.id) in self.departed
+
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        self.departed.set((payload.guild_id, payload.user.id), True)
 
     @commands.Cog.listener("on_member_join")
     async def on_autorole(self, member: discord.Member):
-        member_role_id = (
-            os.getenv("MEMBER_ROLE_ID") if not member.bot else os.getenv("BOT_ROLE_ID")
-        )
-        if not member_role_id:
-            logger.error("MEMBER_ROLE_ID not set in environment")
+        self.departed.pop((member.guild.id, member.id))
+        role_id = self.bot_role_id if member.bot else self.member_role_id
+        if role_id is None:
             return
+        # Waits when the queues are full, pushing back on a raid instead of
+        # growing without bound.
+        await self.role_slots.acquire()
+        self.enqueue((member, role_id, time.monotonic(), 1))
 
-        try:
-            member_role_id = int(member_role_id)
-        except ValueError:
-            logger.error(f"Invalid MEMBER_ROLE_ID: {member_role_id}")
+    def enqueue(self, job: tuple) -> None:
+        """Queue a job holding a ``role_slots`` slot behind its guild's others."""
+        guild_id = job[0].guild.id
+        jobs = self.role_jobs.get(guild_id)
+        if jobs is None:
+            jobs = self.role_jobs[guild_id] = deque()
+            self.ready_guilds.put_nowait(guild_id)
+        jobs.append(job)
+        self.queued += 1
+        metrics.JOIN_QUEUE_DEPTH.set(self.queued)
+
+    def bucket(self, guild: discord.Guild) -> httpclient.TokenBucket:
+        bucket = self.buckets.get(guild.id)
+        if bucket is None:
+            bucket = self.buckets[guild.id] = httpclient.TokenBucket(
+                ROLE_RATE, ROLE_BURST
+            )
+        return bucket
+
+    async def role_worker(self):
+        while True:
+            guild_id = await self.ready_guilds.get()
+            jobs = self.role_jobs[guild_id]
+            job = jobs.popleft()
+            self.queued -= 1
+            metrics.JOIN_QUEUE_DEPTH.set(self.queued)
+            try:
+                await self.assign_role(*job)
+            except Exception as e:
+                logger.error(f"Auto-role worker failed for {job[0]}", exc_info=e)
+            finally:
+                self.role_slots.release()
+                # Jobs that arrived meanwhile go back in line behind other
+                # guilds.
+                if jobs:
+                    self.ready_guilds.put_nowait(guild_id)
+                else:
+                    del self.role_jobs[guild_id]
+
+    async def assign_role(
+        self, member: discord.Member, role_id: int, joined_at: float, attempt: int
+    ) -> None:
+        guild = member.guild
+        if self.has_left(member):
+            # Left (or was banned) before we got to them.
             return
 
-        role = member.guild.get_role(member_role_id)
+        role = guild.get_role(role_id)
         if not role:
-            logger.error(f"Role {member_role_id} not found in {member.guild.name}")
+            logger.error(f"Role {role_id} not found in {guild.name}")
             return
 
+        bucket = self.bucket(guild)
+        await bucket.acquire()
         try:
             await member.add_roles(role, reason="Auto-assign on join")
-            logger.info(f"Assigned {role.name} to {member}")
         except discord.Forbidden:
             logger.error(f"Missing permissions to assign {role.name}")
+            return
         except discord.HTTPException as e:
+            if e.status == 429 and attempt < ROLE_MAX_ATTEMPTS:
+                bucket.pause(RATE_LIMIT_PAUSE)
+                # Never block here: every worker could be waiting on full
+                # queues only the workers can drain.
+                if not self.role_slots.locked():
+                    await self.role_slots.acquire()
+                    self.enqueue((member, role_id, joined_at, attempt + 1))
+                    return
             logger.error(f"Failed to assign {role.name} to {member}: {e}")
+            return
+
+        metrics.JOIN_ROLE_LATENCY.observe(time.monotonic() - joined_at)
+        logger.info("Assigned %s to %s", role.name, member)
 
     @commands.Cog.listener("on_member_join")
     async def on_welcome(self, member: discord.Member):
-        if member.bot:
-            return
-        welcome_channel_id = os.getenv("WELCOME_CHANNEL_ID")
-        if not welcome_channel_id:
+        if member.bot or not self.welcome_channel_id:
             return
 
+        self.pending_welcomes.append(member)
+        if self.welcome_task is None:
+            self.welcome_task = asyncio.create_task(self.send_welcomes())
+
+    async def send_welcomes(self):
+        """Welcome the first join right away and batch the rest of a burst."""
         try:
-            channel = self.bot.get_channel(int(welcome_channel_id))
-        except ValueError:
-            logger.error(f"Invalid WELCOME_CHANNEL_ID: {welcome_channel_id}")
-            return
+            while self.pending_welcomes:
+                members, self.pending_welcomes = self.pending_welcomes, []
+                await self.welcome(members)
+                await asyncio.sleep(WELCOME_COALESCE_SECONDS)
+        finally:
+            self.welcome_task = None
 
+    async def welcome(self, members: list[discord.Member]) -> None:
+        channel = self.bot.get_channel(self.welcome_channel_id)  # type: ignore
         if not channel:
             return
 
-        rules_mention = f"<#{self.rules_channel_id}>" if self.rules_channel_id else ""
-        announcements_mention = (
-            f"<#{self.announcements_channel_id}>"
-            if self.announcements_channel_id
-            else ""
-        )
-
-        message = (
-            f"# 📺 Welcome to the Community, {member.mention}! 📺\n\n"
-            f"{rules_mention}\n"
-            "_Breaking the contract will incur a **1,000,000 yen fee**._ 💸\n\n"
-            "-# 📢 Announcements\n"
-            f"{announcements_mention}\n\n"
-            "-# ⚙️ Channels & Roles\n"
-            "Visit **Channels & Roles** above the channels to subscribe for more roles and unlock extra channels.\n\n"
-            "**Enjoy your stay!**"
-        )
-
-        try:
-            await channel.send(message)  # type: ignore
-        except discord.HTTPException as e:
-            logger.error(
-                f"Failed to send welcome message to {member.name} ({member.id}): {e}"
+        members = [m for m in members if not self.has_left(m)]
+        for i in range(0, len(members), WELCOME_MAX_MENTIONS):
+            chunk = members[i : i + WELCOME_MAX_MENTIONS]
+            message = welcome_message(
+                ", ".join(m.mention for m in chunk),
+                self.rules_mention,
+                self.announcements_mention,
             )
+            try:
+                await self.bot.outbound.send_message(  # type: ignore
+                    channel, content=message, priority=dispatcher.NORMAL
+                )
+            except discord.HTTPException as e:
+                names = ", ".join(f"{m.name} ({m.id})" for m in chunk)
+                logger.error(f"Failed to send welcome message to {names}: {e}")
 
 
 async def setup(bot: commands.Bot):
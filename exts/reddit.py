@@ -1,69 +1,245 @@
+import datetime
 import os
+import urllib.parse
 import discord
 from discord.ext import commands, tasks
-import aiohttp
+import feedpoller
+import httpclient
+import metrics
 import mylogger
+import profiler
+import scheduler
+import storage
 import utils
 
 logger = mylogger.getLogger(__name__)
 
-REDDIT_URL = "https://www.reddit.com/r/WelcomeToTheNHK/new.json?limit=1"
+LAZY = True
+
+REDDIT_BASE = os.getenv("REDDIT_BASE_URL", "https://www.reddit.com")
+REDDIT_HOST = urllib.parse.urlsplit(REDDIT_BASE).hostname
 REDDIT_USER_AGENT = "DiscordBot:com.yourcompany.NHKFeed:v1.0 (by /u/ephemeral8997)"
+CURSOR_KEY = "reddit:cursor"
+LEGACY_CURSOR_KEY = "reddit:last_post_id"
+
+# Followed in REDDIT_WELCOME_CHANNEL_ID from the first start.
+SUBREDDIT = "WelcomeToTheNHK"
+CHANNEL_ID = int(os.getenv("REDDIT_WELCOME_CHANNEL_ID", "0"))
+WEBHOOK_NAME = "r/WelcomeToTheNHK"
+
+FETCH_LIMIT = 25
+# Reddit allows unauthenticated clients roughly ten requests a minute.
+REDDIT_REQUESTS_PER_MINUTE = 10
+REQUEST_TIMEOUT = 10
+POLL_MIN_SECONDS = float(os.getenv("REDDIT_POLL_MIN", "60"))
+POLL_MAX_SECONDS = float(os.getenv("REDDIT_POLL_MAX", "900"))
+# A "before" cursor pointing at a deleted post yields empty listings forever,
+# so after a run of empty polls we re-read the newest posts without it.
+RESYNC_AFTER_EMPTY_POLLS = 15
+# Listing URLs whose ETag/Last-Modified are kept per subreddit: the before=
+# URL and the one used to resync.
+MAX_VALIDATORS = 4
+
+
+class Subreddit:
+    """Listing cursor and cache validators for one subscribed subreddit."""
 
+    def __init__(self, name: str):
+        self.name = name
+        self.url = f"{REDDIT_BASE}/r/{name}/new.json"
+        self.cursor: dict | None = None
+        self.empty_polls = 0
+        self.validators: dict[str, tuple[str | None, str | None]] = {}
+        # The configured subreddit keeps the cursor key it had before feeds
+        # could follow more than one.
+        self.cursor_key = CURSOR_KEY if name == SUBREDDIT else f"{CURSOR_KEY}:{name}"
+
+
+class WelcomeNHKFeed(feedpoller.FeedPoller):
+    kind = "reddit"
 
-class WelcomeNHKFeed(commands.Cog):
     def __init__(self, bot: commands.Bot):
-        self.bot = bot
-        self.channel_id = int(os.getenv("REDDIT_WELCOME_CHANNEL_ID", 0))
-        self.last_post_id = None
-        self.webhook_name = "r/WelcomeToTheNHK"
-        self.session_manager = utils.SessionManager()
+        super().__init__(bot)
+        self.subreddits: dict[str, Subreddit] = {}
+        self.http = bot.http_client  # type: ignore
+        self.http.configure_host(
+            REDDIT_HOST,
+            rate=REDDIT_REQUESTS_PER_MINUTE / 60,
+            burst=2,
+            headers={"User-Agent": REDDIT_USER_AGENT},
+            timeout=REQUEST_TIMEOUT,
+        )
+        self.interval = scheduler.register(
+            "reddit", POLL_MIN_SECONDS, POLL_MAX_SECONDS
+        )
         self.fetch_reddit_posts.start()
 
+    async def cog_load(self) -> None:
+        await storage.state_store.load()
+        await storage.subscriptions.load()
+        await self.seed_subscription(SUBREDDIT, CHANNEL_ID, WEBHOOK_NAME, {})
+
     async def cog_unload(self) -> None:
         self.fetch_reddit_posts.cancel()
-        await self.session_manager.close()
+        await storage.state_store.flush()
+
+    def get_subreddit(self, name: str) -> Subreddit:
+        subreddit = self.subreddits.get(name)
+        if subreddit is None:
+            subreddit = self.subreddits[name] = Subreddit(name)
+            subreddit.cursor = storage.state_store.get(subreddit.cursor_key)
+            if (
+                subreddit.cursor is None
+                and name == SUBREDDIT
+                and (legacy := storage.state_store.get(LEGACY_CURSOR_KEY))
+            ):
+                # Its creation time is looked up on the first resync.
+                subreddit.cursor = {"name": f"t3_{legacy}", "created": None}
+        return subreddit
 
-    @tasks.loop(minutes=10)
+    @tasks.loop(seconds=POLL_MIN_SECONDS)
+    @profiler.timed
     async def fetch_reddit_posts(self):
-        if not self.channel_id:
+        if not self.leading():
+            self.fetch_reddit_posts.change_interval(seconds=self.interval.floor)
             return
+        activity = await self.poll_once()
+        self.fetch_reddit_posts.change_interval(
+            seconds=self.interval.record(activity)
+        )
+
+    def reset(self) -> None:
+        self.subreddits.clear()
+
+    async def poll_source(self, source: str, subs: list[storage.Subscription]) -> bool:
+        """Fetch one subreddit once and post new posts to every subscriber."""
+        subreddit = self.get_subreddit(source)
+        posts = await self.fetch_new_posts(subreddit)
+
+        if not posts:
+            if posts is not None:
+                subreddit.empty_polls += 1
+            outcome = "error" if posts is None else "none"
+            metrics.FEED_POLLS.labels("reddit", outcome).inc()
+            return False
+
+        subreddit.empty_polls = 0
+        newest = posts[0]
+        subreddit.cursor = {
+            "name": newest["name"],
+            "created": newest.get("created_utc", 0),
+        }
+        storage.state_store.set(subreddit.cursor_key, subreddit.cursor)
+
+        items = [
+            feedpoller.FeedItem(
+                post["name"], post, self.build_embed(post), post.get("created_utc")
+            )
+            for post in reversed(posts)
+            if any(self.should_post(post, sub.filters) for sub in subs)
+        ]
+        await self.fan_out(subs, items)
+        return True
+
+    async def fetch_new_posts(self, subreddit: Subreddit) -> list[dict] | None:
+        """Posts newer than the subreddit's cursor, newest first."""
+        cursor = subreddit.cursor
+        if cursor is None:
+            return await self.fetch_listing(subreddit, {"limit": "1"})
+
+        if subreddit.empty_polls >= RESYNC_AFTER_EMPTY_POLLS:
+            subreddit.empty_polls = 0
+            posts = await self.fetch_listing(subreddit, {"limit": str(FETCH_LIMIT)})
+            if not posts:
+                return posts
+            if cursor["created"] is None:
+                names = [p["name"] for p in posts]
+                if cursor["name"] not in names:
+                    # A legacy cursor whose post is gone or too old to place:
+                    # start from the newest post rather than repost the page.
+                    logger.info(f"Resetting r/{subreddit.name} cursor to newest post")
+                    subreddit.cursor = {
+                        "name": posts[0]["name"],
+                        "created": posts[0].get("created_utc", 0),
+                    }
+                    storage.state_store.set(subreddit.cursor_key, subreddit.cursor)
+                    return []
+                return posts[: names.index(cursor["name"])]
+            return [
+                p
+                for p in posts
+                if p.get("created_utc", 0) > cursor["created"]
+                and p["name"] != cursor["name"]
+            ]
+
+        return await self.fetch_listing(
+            subreddit, {"limit": str(FETCH_LIMIT), "before": cursor["name"]}
+        )
 
-        headers = {"User-Agent": REDDIT_USER_AGENT}
+    async def fetch_listing(
+        self, subreddit: Subreddit, params: dict
+    ) -> list[dict] | None:
+        """Fetch new posts, newest first; [] if unchanged, None on error."""
+        url = f"{subreddit.url}?{urllib.parse.urlencode(params)}"
+        headers = {"Accept-Encoding": "gzip"}
+        etag, last_modified = subreddit.validators.get(url, (None, None))
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
 
         try:
-            session = await self.session_manager.get_session()
-            async with session.get(REDDIT_URL, headers=headers) as resp:
-                if resp.status != 200:
-                    logger.warning(f"Reddit API returned status {resp.status}")
-                    return
-                data = await resp.json()
+            resp = await self.http.get(
+                url, headers=headers, slots=scheduler.fetch_slots
+            )
+            if resp.status == 304:
+                return []
+            if resp.status != 200:
+                logger.warning(
+                    f"Reddit API returned status {resp.status} for r/{subreddit.name}"
+                )
+                return None
+            data = resp.json()
+            validators = subreddit.validators
+            validators.pop(url, None)
+            validators[url] = (
+                resp.headers.get("ETag"),
+                resp.headers.get("Last-Modified"),
+            )
+            while len(validators) > MAX_VALIDATORS:
+                del validators[next(iter(validators))]
+        except httpclient.CircuitOpenError as e:
+            logger.debug("Skipping r/%s: %s", subreddit.name, e)
+            return None
         except Exception as e:
-            logger.error(f"Error fetching Reddit data: {e}")
-            return
+            logger.error(f"Error fetching r/{subreddit.name}: {e}")
+            return None
 
         try:
-            post = data["data"]["children"][0]["data"]
-            post_id = post["id"]
+            return [child["data"] for child in data["data"]["children"]]
         except Exception as e:
-            logger.error(f"Error parsing Reddit post: {e}")
-            return
+            logger.error(f"Error parsing Reddit listing: {e}")
+            return None
 
-        if post_id == self.last_post_id:
-            return
-
-        self.last_post_id = post_id
-        channel = self.bot.get_channel(self.channel_id)
-        if not channel:
-            logger.warning(f"Channel {self.channel_id} not found")
-            return
+    def should_post(self, post: dict, filters: dict) -> bool:
+        flairs = filters.get("flairs")
+        if flairs:
+            flair = (post.get("link_flair_text") or "").casefold()
+            return flair in flairs
+        return True
 
+    def build_embed(self, post: dict) -> discord.Embed:
+        created = post.get("created_utc")
         embed = discord.Embed(
             title=post["title"],
             url=f"https://reddit.com{post['permalink']}",
             description=utils.truncate_text(post.get("selftext", "")),
             color=discord.Color.orange(),
-            timestamp=discord.utils.utcnow(),
+            timestamp=(
+                datetime.datetime.fromtimestamp(created, tz=datetime.timezone.utc)
+                if created
+                else discord.utils.utcnow()
+            ),
         )
 
         embed.set_thumbnail(
@@ -88,20 +264,7 @@ class WelcomeNHKFeed(commands.Cog):
             embed.add_field(name="Crossposted from", value=origin, inline=False)
 
         embed.set_footer(text=f"Posted by u/{post.get('author', 'unknown')}")
-
-        try:
-            webhook = await utils.WebhookHelper.get_or_create_webhook(
-                channel, self.webhook_name  # type: ignore
-            )
-            if not await utils.WebhookHelper.should_post_via_webhook(
-                channel, webhook, embed  # type: ignore
-            ):
-                return
-
-            await webhook.send(embed=embed, username=self.webhook_name)
-            logger.info(f"Posted new Reddit post to #{channel.name}")  # type: ignore
-        except Exception as e:
-            logger.error(f"Error sending webhook: {e}")
+        return embed
 
     @fetch_reddit_posts.before_loop
     async def before_fetch(self):
@@ -0,0 +1,262 @@
+import abc
+import asyncio
+import ipaddress
+import os
+import time
+import urllib.parse
+import discord
+from discord.ext import commands
+import metrics
+import mylogger
+import storage
+import utils
+
+logger = mylogger.getLogger(__name__)
+
+# The wiki the bot is configured for: its feed, link replies and digest.
+WIKI_BASE = os.getenv("WIKI_BASE_URL", "https://welcometothenhk.fandom.com")
+
+# Domains (and their subdomains) whose wikis feeds may follow. The configured
+# wiki is always allowed.
+FEED_WIKI_DOMAINS = [
+    d.strip().lower().lstrip(".")
+    for d in os.getenv("FEED_WIKI_DOMAINS", "fandom.com").split(",")
+    if d.strip()
+]
+
+
+def wiki_allowed(base: str) -> bool:
+    """Whether feeds may poll ``base``: https on a named host in an allowed domain.
+
+    Subscriptions are made by guild admins, so anything else (other schemes,
+    ports, IP literals, internal hosts) would let them point the bot at
+    arbitrary addresses and have the responses posted to Discord.
+    """
+    if base == WIKI_BASE:
+        return True
+    try:
+        parts = urllib.parse.urlsplit(base)
+        port = parts.port
+    except ValueError:
+        return False
+    host = parts.hostname or ""
+    if parts.scheme != "https" or port is not None or parts.username:
+        return False
+    try:
+        ipaddress.ip_address(host)
+        return False
+    except ValueError:
+        pass
+    return any(host == d or host.endswith(f".{d}") for d in FEED_WIKI_DOMAINS)
+
+# Sources polled whether or not anyone subscribes to them, for cogs that
+# consume the feed's events: (kind, source) -> names of the watching cogs.
+watched: dict[tuple[str, str], set[str]] = {}
+
+
+def watch(kind: str, source: str, watcher: str) -> None:
+    watched.setdefault((kind, source), set()).add(watcher)
+
+
+def unwatch(kind: str, source: str, watcher: str) -> None:
+    watchers = watched.get((kind, source))
+    if watchers is not None:
+        watchers.discard(watcher)
+        if not watchers:
+            del watched[(kind, source)]
+
+
+class FeedItem:
+    """An upstream item ready to post: its posted-index key, data and embed."""
+
+    __slots__ = ("key", "data", "embed", "created")
+
+    def __init__(
+        self, key: str, data: dict, embed: discord.Embed, created: float | None
+    ):
+        self.key = key
+        self.data = data
+        # Built once and shared by every subscriber.
+        self.embed = embed
+        # Unix time the item was created upstream, for the post-lag metric.
+        self.created = created
+
+
+class FeedPollerMeta(commands.CogMeta, abc.ABCMeta):
+    """Cog metaclass that also enforces abstract methods."""
+
+
+class FeedPoller(commands.Cog, metaclass=FeedPollerMeta):
+    """Base for cogs that poll feed sources and post to their subscribers.
+
+    Subclasses set ``kind`` (the subscription kind they serve) and implement
+    :meth:`poll_source`, which fetches one source and passes its new items to
+    :meth:`fan_out`, and :meth:`should_post`, which applies a subscription's
+    filters. Only the lease-holding leader polls.
+    """
+
+    kind = ""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.term = 0
+
+    async def seed_subscription(
+        self, source: str, channel_id: int, webhook: str, filters: dict
+    ) -> None:
+        """Subscribe ``channel_id`` to the configured source.
+
+        Done on first start and again whenever the configuration changes;
+        otherwise the subscription is managed with the /feed commands.
+        """
+        if not channel_id:
+            return
+        seeded_key = f"subscriptions:seeded:{self.kind}"
+        config = {
+            "source": source,
+            "channel_id": channel_id,
+            "webhook": webhook,
+            "filters": filters,
+        }
+        seeded = storage.state_store.get(seeded_key)
+        if seeded == config:
+            return
+
+        if seeded is None:
+            # First start: feeds already set up with /feed are left alone.
+            if not storage.subscriptions.count(self.kind):
+                await storage.subscriptions.add(
+                    self.kind, source, channel_id, webhook, filters
+                )
+        elif seeded is True:
+            # Seeded before the applied configuration was recorded: bring the
+            # subscription in line with it, unless it has been removed.
+            sub = storage.subscriptions.get(self.kind, source, channel_id)
+            if sub is None:
+                logger.warning(
+                    f"Configured {self.kind} feed of {source} in {channel_id} "
+                    "is not subscribed; not re-adding it"
+                )
+            elif (sub.webhook, sub.filters) != (webhook, filters):
+                logger.info(f"Applying the configured {self.kind} feed filters")
+                await storage.subscriptions.add(
+                    self.kind, source, channel_id, webhook, filters
+                )
+        else:
+            logger.info(f"Configured {self.kind} feed changed; applying it")
+            if (seeded["source"], seeded["channel_id"]) != (source, channel_id):
+                old = storage.subscriptions.get(
+                    self.kind, seeded["source"], seeded["channel_id"]
+                )
+                if old is not None:
+                    await storage.subscriptions.remove(old)
+            await storage.subscriptions.add(
+                self.kind, source, channel_id, webhook, filters
+            )
+        storage.state_store.set(seeded_key, config)
+
+    def leading(self) -> bool:
+        """Whether this process should poll now.
+
+        After an election, cached cursors are dropped with :meth:`reset`:
+        another process may have led and advanced them since they were read.
+        """
+        leader = self.bot.leader  # type: ignore
+        if not leader.is_leader:
+            return False
+        if self.term != leader.term:
+            self.term = leader.term
+            self.reset()
+        return True
+
+    def reset(self) -> None:
+        """Forget cached cursors so they are read again from the state store."""
+
+    def sources(self) -> dict[str, list[storage.Subscription]]:
+        """Subscriptions of this kind, grouped by the source they follow.
+
+        Watched sources are included even when nobody subscribes to them.
+        """
+        sources = storage.subscriptions.by_source(self.kind)
+        for kind, source in watched:
+            if kind == self.kind:
+                sources.setdefault(source, [])
+        return sources
+
+    async def poll_once(self) -> bool:
+        """Poll every subscribed source once; True if anything new was seen."""
+        await storage.subscriptions.refresh()
+        results = await asyncio.gather(
+            *(self.poll_source(source, subs) for source, subs in self.sources().items())
+        )
+        return any(results)
+
+    @abc.abstractmethod
+    async def poll_source(self, source: str, subs: list[storage.Subscription]) -> bool:
+        """Fetch ``source`` once and post its new items to ``subs``.
+
+        Returns whether anything new was seen.
+        """
+
+    def should_post(self, data: dict, filters: dict) -> bool:
+        return True
+
+    async def fan_out(
+        self, subs: list[storage.Subscription], items: list[FeedItem]
+    ) -> None:
+        """Post ``items``, oldest first, to every subscriber that wants them.
+
+        Waits until they are sent and records each in the posted index.
+        """
+        if not subs:
+            return
+        sends = []
+        for sub in subs:
+            channel = await self.bot.get_or_fetch_channel(  # type: ignore
+                sub.channel_id
+            )
+            if channel is None:
+                logger.warning(f"Channel {sub.channel_id} not found")
+                continue
+            try:
+                sends.extend(await self.enqueue(channel, sub, items))
+            except Exception as e:
+                logger.error(f"Failed to queue {self.kind} items for #{channel}: {e}")
+
+        outcome = "new" if sends else "filtered"
+        metrics.FEED_POLLS.labels(self.kind, outcome).inc()
+
+        for channel, sub, item, future in sends:
+            try:
+                await future
+            except Exception as e:
+                logger.error(f"Failed to post {item.key} to #{channel}: {e}")
+                continue
+            if item.created:
+                lag = time.time() - item.created
+                metrics.FEED_POST_LAG.labels(self.kind).observe(lag)
+            await utils.WebhookHelper.mark_posted(sub.feed, item.key)
+
+    async def enqueue(
+        self, channel, sub: storage.Subscription, items: list[FeedItem]
+    ) -> list[tuple]:
+        """Queue the items ``sub`` wants; returns the pending sends."""
+        webhook = await utils.WebhookHelper.get_or_create_webhook(channel, sub.webhook)
+        # A cold feed's history is scanned once for all of its items, before
+        # the first match warms the feed.
+        recent = None
+        if items and await storage.posted_index.is_cold(sub.feed):
+            recent = await utils.WebhookHelper.recent_urls(channel, webhook)
+        sends = []
+        for item in items:
+            if not self.should_post(item.data, sub.filters):
+                continue
+            if not await utils.WebhookHelper.should_post_via_webhook(
+                channel, webhook, item.embed, sub.feed, item.key, recent
+            ):
+                continue
+            future = self.bot.outbound.send_webhook(  # type: ignore
+                channel, sub.webhook, embed=item.embed, username=sub.webhook
+            )
+            sends.append((channel, sub, item, future))
+        return sends
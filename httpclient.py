@@ -0,0 +1,340 @@
+import asyncio
+import contextlib
+import email.utils
+import json
+import random
+import time
+import urllib.parse
+from typing import Callable
+import aiohttp
+import mylogger
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+logger = mylogger.getLogger(__name__)
+
+# Called as hook(host, method, status, elapsed_seconds); status is None when
+# the request failed before a response arrived.
+RequestHook = Callable[[str, str, int | None, float], None]
+
+MAX_RETRY_AFTER = 60.0
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+
+def loads(data: bytes | str):
+    """Decode JSON with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status: int, url: str):
+        super().__init__(f"HTTP {status} for {url}")
+        self.status = status
+        self.url = url
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while a host's circuit is open."""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"Circuit for {host} is open, retrying in {retry_in:.0f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Stops sending requests to a host that keeps failing.
+
+    ``threshold`` consecutive failures open the circuit. Once the cooldown
+    has passed a single probe is let through (half-open): success closes
+    the circuit, failure reopens it with the cooldown doubled, up to
+    ``max_delay``. Cooldowns are jittered so sources recover out of step.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        threshold: int = 5,
+        base_delay: float = 5.0,
+        max_delay: float = 300.0,
+    ):
+        self.host = host
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.state = CLOSED
+        self.failures = 0
+        self.openings = 0
+        self.retry_at = 0.0
+        self._probing = False
+
+    def before_request(self) -> None:
+        """Raise :class:`CircuitOpenError` unless a request may go out now."""
+        if self.state == CLOSED:
+            return
+        now = time.monotonic()
+        if self.state == OPEN and now >= self.retry_at:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        raise CircuitOpenError(self.host, max(0.0, self.retry_at - now))
+
+    def record(self, ok: bool | None) -> None:
+        """Record a request outcome; None when it was abandoned (cancelled)."""
+        self._probing = False
+        if ok is None:
+            return
+        if ok:
+            if self.state != CLOSED:
+                logger.info(f"Circuit for {self.host} closed")
+            self.state = CLOSED
+            self.failures = 0
+            self.openings = 0
+            return
+
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            self.openings += 1
+            delay = min(self.max_delay, self.base_delay * 2 ** (self.openings - 1))
+            delay = random.uniform(delay / 2, delay)
+            self.state = OPEN
+            self.retry_at = time.monotonic() + delay
+            logger.warning(
+                f"Circuit for {self.host} opened for {delay:.1f}s "
+                f"after {self.failures} failures"
+            )
+
+
+class TokenBucket:
+    """Token bucket allowing ``rate`` requests per second with ``burst`` slack."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request to this bucket for ``seconds``."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HTTPResponse:
+    """Fully read response returned by :class:`HTTPClient`."""
+
+    __slots__ = ("status", "headers", "body", "url")
+
+    def __init__(self, status: int, headers, body: bytes, url: str):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.url = url
+
+    def json(self):
+        return loads(self.body)
+
+    def raise_for_status(self) -> None:
+        if self.status >= 400:
+            raise HTTPStatusError(self.status, self.url)
+
+
+class HTTPClient:
+    """Bot-wide HTTP client shared by every extension.
+
+    Owns a single keep-alive connection pool, applies per-host default
+    headers, timeouts and token-bucket rate limits, and waits out ``429``
+    responses according to ``Retry-After``. Every host gets a
+    :class:`CircuitBreaker`; connection errors, timeouts and ``5xx``
+    responses count as failures.
+    """
+
+    def __init__(
+        self,
+        *,
+        limit: int = 64,
+        limit_per_host: int = 8,
+        dns_ttl: int = 300,
+        timeout: float = 30.0,
+        max_retries: int = 2,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_retries = max_retries
+        self.hooks: list[RequestHook] = []
+        self._session: aiohttp.ClientSession | None = None
+        self._headers: dict[str, dict[str, str]] = {}
+        self._buckets: dict[str, TokenBucket] = {}
+        self._timeouts: dict[str, aiohttp.ClientTimeout] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def configure_host(
+        self,
+        host: str,
+        *,
+        rate: float | None = None,
+        burst: int = 1,
+        headers: dict[str, str] | None = None,
+        timeout: float | None = None,
+    ) -> None:
+        """Set the rate limit, default headers and timeout used for ``host``."""
+        if rate is not None:
+            self._buckets[host] = TokenBucket(rate, burst)
+        if headers:
+            self._headers.setdefault(host, {}).update(headers)
+        if timeout is not None:
+            self._timeouts[host] = aiohttp.ClientTimeout(total=timeout)
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(host)
+        return breaker
+
+    def circuit_states(self) -> dict[str, str]:
+        """Circuit state of every host requested so far."""
+        return {host: b.state for host, b in self._breakers.items()}
+
+    def add_hook(self, hook: RequestHook) -> None:
+        self.hooks.append(hook)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=60,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout
+            )
+        return self._session
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: dict[str, str] | None = None,
+        slots: asyncio.Semaphore | None = None,
+        **kwargs,
+    ) -> HTTPResponse:
+        """Send a request, retrying on 429.
+
+        ``slots`` limits concurrency across callers. A slot is taken only
+        once the host's rate limit lets the request go, and only for the
+        request itself, so requests waiting on one host's bucket never hold
+        slots others could use.
+        """
+        host = urllib.parse.urlsplit(url).hostname or ""
+        merged = {**self._headers.get(host, {}), **(headers or {})}
+        bucket = self._buckets.get(host)
+        breaker = self.breaker(host)
+        if host in self._timeouts:
+            kwargs.setdefault("timeout", self._timeouts[host])
+
+        for attempt in range(self.max_retries + 1):
+            breaker.before_request()
+            if bucket is not None:
+                try:
+                    await bucket.acquire()
+                except BaseException:
+                    breaker.record(None)
+                    raise
+
+            started = time.perf_counter()
+            status = None
+            ok = None
+            try:
+                async with slots if slots is not None else contextlib.nullcontext():
+                    started = time.perf_counter()
+                    async with self.session.request(
+                        method, url, headers=merged, **kwargs
+                    ) as resp:
+                        status = resp.status
+                        body = await resp.read()
+                        response = HTTPResponse(resp.status, resp.headers, body, url)
+                ok = response.status < 500
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                ok = False
+                raise
+            finally:
+                breaker.record(ok)
+                self._run_hooks(host, method, status, time.perf_counter() - started)
+
+            if response.status != 429 or attempt == self.max_retries:
+                return response
+
+            delay = parse_retry_after(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = 2.0**attempt
+            if delay > MAX_RETRY_AFTER:
+                return response
+            logger.warning(f"Rate limited by {host}, retrying in {delay:.1f}s")
+            if bucket is not None:
+                bucket.pause(delay)
+            else:
+                await asyncio.sleep(delay)
+
+        return response
+
+    async def get(self, url: str, **kwargs) -> HTTPResponse:
+        return await self.request("GET", url, **kwargs)
+
+    def _run_hooks(
+        self, host: str, method: str, status: int | None, elapsed: float
+    ) -> None:
+        for hook in self.hooks:
+            try:
+                hook(host, method, status, elapsed)
+            except Exception as e:
+                logger.error(f"HTTP hook {hook!r} failed: {e}")
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
@@ -0,0 +1,203 @@
+import abc
+import asyncio
+import os
+import socket
+import time
+import mylogger
+import storage
+import utils
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = mylogger.getLogger(__name__)
+
+LEASE_BACKEND = os.getenv("LEADER_LEASE", "sqlite").lower()
+LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "10"))
+LEASE_NAME = "pollers"
+LOCK_FILE = "leader.lock"
+
+
+class LeaseBackend(abc.ABC):
+    """Storage for a named, expiring lease shared between processes."""
+
+    @abc.abstractmethod
+    async def acquire(self, name: str, holder: str, ttl: float) -> bool:
+        """Take or renew the lease; returns whether ``holder`` now has it."""
+
+    @abc.abstractmethod
+    async def release(self, name: str, holder: str) -> None:
+        """Give up the lease if ``holder`` has it."""
+
+
+class LocalLease(LeaseBackend):
+    """Always granted; for a single process that needs no coordination."""
+
+    async def acquire(self, name: str, holder: str, ttl: float) -> bool:
+        return True
+
+    async def release(self, name: str, holder: str) -> None:
+        pass
+
+
+class SQLiteLease(LeaseBackend):
+    """Lease row in the shared SQLite database, expiring after ``ttl``.
+
+    Works for processes on one host sharing ``DATA_DIR``. Expiry uses wall
+    clock time, so every holder must share a clock.
+    """
+
+    def __init__(self, db: storage.Database):
+        self.db = db
+        self._ready = False
+
+    async def _setup(self) -> None:
+        if self._ready:
+            return
+        await self.db.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            "name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._ready = True
+
+    async def acquire(self, name: str, holder: str, ttl: float) -> bool:
+        await self._setup()
+        now = time.time()
+        await self.db.execute(
+            "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET "
+            "holder = excluded.holder, expires_at = excluded.expires_at "
+            "WHERE leases.holder = excluded.holder OR leases.expires_at < ?",
+            (name, holder, now + ttl, now),
+        )
+        rows = await self.db.execute(
+            "SELECT holder FROM leases WHERE name = ?", (name,)
+        )
+        return bool(rows) and rows[0][0] == holder
+
+    async def release(self, name: str, holder: str) -> None:
+        await self._setup()
+        await self.db.execute(
+            "DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder)
+        )
+
+
+class FileLease(LeaseBackend):
+    """Exclusive ``flock`` on a lock file.
+
+    The kernel drops the lock the moment the holding process dies, so a
+    standby takes over on its next attempt. ``ttl`` is not needed.
+    """
+
+    def __init__(self, filename: str = LOCK_FILE):
+        if fcntl is None:
+            raise RuntimeError("File leases need fcntl, which this platform lacks")
+        self.filename = filename
+        self._files: dict[str, object] = {}
+
+    async def acquire(self, name: str, holder: str, ttl: float) -> bool:
+        if name in self._files:
+            return True
+        f = open(utils.data_path(f"{name}.{self.filename}"), "a+")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)  # type: ignore
+        except BlockingIOError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(holder)
+        f.flush()
+        self._files[name] = f
+        return True
+
+    async def release(self, name: str, holder: str) -> None:
+        f = self._files.pop(name, None)
+        if f is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)  # type: ignore
+            f.close()  # type: ignore
+
+
+def create_backend(kind: str = LEASE_BACKEND) -> LeaseBackend:
+    if kind == "file":
+        return FileLease()
+    if kind == "none":
+        return LocalLease()
+    if kind != "sqlite":
+        logger.warning(f"Unknown LEADER_LEASE {kind!r}, using sqlite")
+    return SQLiteLease(storage.db)
+
+
+class Leader:
+    """Holds, renews or waits for the lease that lets this process poll.
+
+    ``is_leader`` turns false on its own once a renewal is overdue, before
+    the lease can expire for other processes. ``term`` increases with each
+    election so pollers can tell when to reload state written by the
+    previous leader.
+    """
+
+    def __init__(
+        self, backend: LeaseBackend, name: str = LEASE_NAME, ttl: float = LEASE_TTL
+    ):
+        self.backend = backend
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self.term = 0
+        self._valid_until = 0.0
+        self._listeners = []
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    def add_listener(self, callback) -> None:
+        """Run ``await callback()`` each time this process becomes leader."""
+        self._listeners.append(callback)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="leader-lease")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            self._valid_until = 0.0
+            try:
+                await self.backend.release(self.name, self.holder)
+            except Exception as e:
+                logger.warning(f"Failed to release the {self.name} lease: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                held = await self.backend.acquire(self.name, self.holder, self.ttl)
+            except Exception as e:
+                # Keep whatever validity is left; it runs out on its own.
+                logger.warning(f"Failed to renew the {self.name} lease: {e}")
+            else:
+                if held and not self.is_leader:
+                    await self._elected()
+                elif not held and self.is_leader:
+                    logger.warning(f"Lost the {self.name} lease")
+                # Stop counting ourselves leader well before other processes
+                # may take the lease over.
+                self._valid_until = started + self.ttl * 0.8 if held else 0.0
+            await asyncio.sleep(self.ttl / 3)
+
+    async def _elected(self) -> None:
+        self.term += 1
+        logger.info(f"Acquired the {self.name} lease as {self.holder}")
+        for callback in self._listeners:
+            try:
+                await callback()
+            except Exception as e:
+                logger.error(f"Leader election callback failed: {e}", exc_info=e)
@@ -1,18 +1,79 @@
 from discord.ext import commands
 from dotenv import load_dotenv
 import discord
+import dispatcher
+import httpclient
+import metrics
 import mylogger
+import ast
 import asyncio
+import hashlib
+import importlib.util
+import json
+import lease
+import memory
 import os
 import pkgutil
+import profiler
+import scheduler
+import signal
+import storage
+import sys
+import time
+import utils
 import webserver
 
 load_dotenv()
 
 logger = mylogger.getLogger(__name__)
 
+TREE_FINGERPRINT_KEY = "tree:fingerprint"
+CHANNEL_CACHE_TTL = 3600
+# Seconds a SIGTERM has to finish in-flight work before closing; keep it
+# under the orchestrator's kill timeout.
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))
+# Part of SHUTDOWN_TIMEOUT kept back from draining for checkpoint and close.
+SHUTDOWN_RESERVE = 3.0
+FORCE_TREE_SYNC = "--sync" in sys.argv or os.getenv(
+    "FORCE_TREE_SYNC", "false"
+).lower() in ("1", "true", "yes")
 
-class Pururin(commands.Bot):
+
+def is_lazy_extension(module_name: str) -> bool:
+    """Whether the extension declares ``LAZY = True`` at module level.
+
+    The source is parsed rather than imported so lazy extensions cost
+    nothing before the gateway is ready.
+    """
+    spec = importlib.util.find_spec(module_name)
+    if spec is None or not spec.origin:
+        return False
+    with open(spec.origin, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), spec.origin)
+    for node in tree.body:
+        if (
+            isinstance(node, ast.Assign)
+            and any(isinstance(t, ast.Name) and t.id == "LAZY" for t in node.targets)
+            and isinstance(node.value, ast.Constant)
+        ):
+            return node.value.value is True
+    return False
+
+
+def shard_options() -> dict:
+    """shard_count/shard_ids from SHARD_COUNT and SHARD_IDS ("0,1"), if set.
+
+    Without them the bot runs every shard Discord recommends in one process.
+    """
+    options = {}
+    if count := os.getenv("SHARD_COUNT"):
+        options["shard_count"] = int(count)
+    if ids := os.getenv("SHARD_IDS"):
+        options["shard_ids"] = [int(i) for i in ids.split(",") if i.strip()]
+    return options
+
+
+class Pururin(commands.AutoShardedBot):
     def __init__(self):
         intents = discord.Intents.default()
         intents.message_content = True
@@ -22,33 +83,149 @@ class Pururin(commands.Bot):
             intents=intents,
             help_command=None,
             chunk_guilds_at_startup=False,
+            member_cache_flags=memory.member_cache_flags(intents),
             max_messages=None,
+            **shard_options(),
+        )
+        self.http_client = httpclient.HTTPClient()
+        self.outbound = dispatcher.Dispatcher()
+        self.health = webserver.HealthServer(self)
+        # Only the lease holder runs the feed pollers; event handlers run
+        # in every process.
+        self.leader = lease.Leader(lease.create_backend())
+        self.leader.add_listener(self._on_elected)
+        self._fetched_channels = utils.TTLCache(
+            256, CHANNEL_CACHE_TTL, name="fetched-channels"
         )
+        self.memory = memory.MemoryReporter(self)
+        self.http_client.add_hook(metrics.record_http)
+        metrics.registry.add_collector(self._collect_metrics)
+        metrics.registry.add_collector(self.memory.collect)
+        self._phase_started = time.perf_counter()
+        self._connected_once = False
+        self._ready_once = False
+        self._lazy_extensions: list[str] = []
+        self._setup_times: dict[str, float] = {}
+        self.extension_timings: dict[str, dict[str, float]] = {}
+        self._shutdown_task: asyncio.Task | None = None
+        self._close_task: asyncio.Task | None = None
+        # The event loop only keeps weak references to tasks.
+        self._background_tasks: set[asyncio.Task] = set()
+
+    def _log_phase(self, phase: str) -> None:
+        now = time.perf_counter()
+        logger.info(f"Startup phase '{phase}' took {now - self._phase_started:.2f}s")
+        self._phase_started = now
+
+    def spawn(self, coro, name: str | None = None) -> asyncio.Task:
+        """Run ``coro`` as a task kept alive until it finishes; failures are logged."""
+        task = asyncio.create_task(coro, name=name)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_done)
+        return task
+
+    def _background_done(self, task: asyncio.Task) -> None:
+        self._background_tasks.discard(task)
+        if not task.cancelled() and (e := task.exception()):
+            logger.error(f"Task {task.get_name()} failed", exc_info=e)
 
     async def setup_hook(self) -> None:
-        modules = list(pkgutil.iter_modules(["exts"], prefix="exts."))
+        self._phase_started = time.perf_counter()
+        self.outbound.start()
+        profiler.lag_monitor.start()
+        self.memory.start()
+        await self.health.start()
+        self.leader.start()
+
+        modules = [m.name for m in pkgutil.iter_modules(["exts"], prefix="exts.")]
+        self._lazy_extensions = [m for m in modules if is_lazy_extension(m)]
+        eager = [m for m in modules if m not in self._lazy_extensions]
 
+        await self._load_extensions(eager)
+        self._log_phase("extensions")
+
+        # With lazy extensions pending the tree is synced once they are
+        # loaded; syncing it now would drop their commands until then.
+        if not self._lazy_extensions:
+            await self.sync_commands()
+            self._log_phase("sync")
+
+        return await super().setup_hook()
+
+    def command_tree_fingerprint(self) -> str:
+        """Stable hash of the global app-command payload sent by tree.sync()."""
+        payload = [command.to_dict(self.tree) for command in self.tree.get_commands()]
+        payload.sort(key=lambda c: (c.get("type", 1), c["name"]))
+        data = json.dumps(
+            {"application_id": self.application_id, "commands": payload},
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    async def sync_commands(self, force: bool = FORCE_TREE_SYNC) -> None:
+        """Sync the command tree only if it changed since the last sync."""
+        fingerprint = self.command_tree_fingerprint()
+        await storage.state_store.load()
+        if not force and storage.state_store.get(TREE_FINGERPRINT_KEY) == fingerprint:
+            logger.info("Command tree unchanged, skipping sync")
+            return
+
+        synced = await self.tree.sync()
+        storage.state_store.set(TREE_FINGERPRINT_KEY, fingerprint)
+        await storage.state_store.flush()
+        logger.info(f"Synced {len(synced)} commands")
+
+    async def _load_extensions(self, modules: list[str]) -> None:
         tasks = []
         for module in modules:
-            task = asyncio.create_task(self._load_extension_safe(module.name))
+            task = asyncio.create_task(self._load_extension_safe(module))
             tasks.append(task)
 
         results = await asyncio.gather(*tasks, return_exceptions=True)
 
         for module, result in zip(modules, results):
             if isinstance(result, Exception):
-                logger.error(f"Failed to load {module.name}: {result}")
+                logger.error(f"Failed to load {module}: {result}")
             elif result is True:
-                logger.info(f"Loaded extension {module.name}")
+                timing = self.extension_timings.get(module, {})
+                logger.info(
+                    f"Loaded extension {module} in {timing.get('total', 0) * 1000:.1f}ms "
+                    f"(import {timing.get('import', 0) * 1000:.1f}ms, "
+                    f"setup {timing.get('setup', 0) * 1000:.1f}ms)"
+                )
 
-        synced = await self.tree.sync()
-        logger.info(f"Synced {len(synced)} commands")
+    async def _load_lazy_extensions(self) -> None:
+        started = time.perf_counter()
+        await self._load_extensions(self._lazy_extensions)
+        logger.info(
+            f"Loaded {len(self._lazy_extensions)} lazy extensions in "
+            f"{time.perf_counter() - started:.2f}s"
+        )
+        await self.sync_commands()
 
-        return await super().setup_hook()
+    async def add_cog(self, cog: commands.Cog, /, **kwargs) -> None:
+        started = time.perf_counter()
+        try:
+            await super().add_cog(cog, **kwargs)
+        finally:
+            module = type(cog).__module__
+            self._setup_times[module] = self._setup_times.get(module, 0.0) + (
+                time.perf_counter() - started
+            )
 
     async def _load_extension_safe(self, module_name: str) -> bool:
+        started = time.perf_counter()
+        self._setup_times.pop(module_name, None)
         try:
             await self.load_extension(module_name)
+            total = time.perf_counter() - started
+            setup = self._setup_times.pop(module_name, 0.0)
+            self.extension_timings[module_name] = {
+                "total": total,
+                "import": total - setup,
+                "setup": setup,
+            }
             return True
         except commands.ExtensionAlreadyLoaded:
             logger.info(f"Extension {module_name} is already loaded")
@@ -64,12 +241,126 @@ class Pururin(commands.Bot):
             logger.error(f"Unexpected error loading {module_name}", exc_info=e)
             return False
 
+    async def _on_elected(self) -> None:
+        # The previous leader may have advanced cursors and changed
+        # subscriptions since this process read them.
+        await storage.state_store.refresh()
+        await storage.subscriptions.load(max_age=0)
+
+    async def get_or_fetch_channel(self, channel_id: int):
+        """A channel from the cache, or over REST when another shard owns it."""
+        channel = self.get_channel(channel_id)
+        if channel is not None:
+            return channel
+        channel = self._fetched_channels.get(channel_id, utils.MISSING)
+        if channel is not utils.MISSING:
+            return channel
+        try:
+            channel = await self.fetch_channel(channel_id)
+        except (discord.NotFound, discord.Forbidden):
+            channel = None
+        except discord.HTTPException as e:
+            logger.warning(f"Failed to fetch channel {channel_id}: {e}")
+            return None
+        self._fetched_channels.set(channel_id, channel)
+        return channel
+
+    def request_shutdown(self) -> None:
+        """Signal handler: drain and close, or close at once if asked twice."""
+        if self._shutdown_task is None:
+            self._shutdown_task = asyncio.create_task(
+                self._shutdown(SHUTDOWN_TIMEOUT), name="shutdown"
+            )
+        else:
+            logger.warning("Shutdown requested again, closing without draining")
+            self._close_task = asyncio.create_task(self.close(), name="close")
+
+    async def shutdown(self) -> None:
+        if self._shutdown_task is None:
+            self.request_shutdown()
+        await asyncio.shield(self._shutdown_task)  # type: ignore
+
+    async def _shutdown(self, timeout: float) -> None:
+        """Finish in-flight work, checkpoint and close within ``timeout``."""
+        started = time.monotonic()
+        drain_until = started + max(0.0, timeout - SHUTDOWN_RESERVE)
+        logger.info(f"Shutting down within {timeout:g}s")
+
+        # Let running poll iterations (and the posts they wait on) finish,
+        # but start no new ones; then drop loops that were only sleeping.
+        loops = [loop for _, loop in webserver.iter_loops(self)]
+        for loop in loops:
+            loop.stop()
+        while profiler.in_flight and time.monotonic() < drain_until:
+            await asyncio.sleep(0.05)
+        for loop in loops:
+            loop.cancel()
+
+        if not await self.outbound.drain(max(0.0, drain_until - time.monotonic())):
+            logger.warning(f"Dropping {self.outbound.depth} unsent messages")
+        await storage.state_store.flush()
+
+        remaining = max(SHUTDOWN_RESERVE, started + timeout - time.monotonic())
+        try:
+            await asyncio.wait_for(self.close(), remaining)
+        except asyncio.TimeoutError:
+            logger.error(f"Close did not finish within {timeout:g}s")
+        logger.info(f"Shut down in {time.monotonic() - started:.1f}s")
+
+    async def close(self) -> None:
+        await self.health.stop()
+        await self.outbound.close()
+        await profiler.lag_monitor.stop()
+        await self.memory.stop()
+        # Unloads every cog, whose cog_unload checkpoints its state.
+        await super().close()
+        await storage.state_store.flush()
+        # Released only once cursors are saved, so the next leader
+        # resumes where this one stopped.
+        await self.leader.stop()
+        await self.http_client.close()
+
+    async def _run_event(self, coro, event_name: str, *args, **kwargs) -> None:
+        started = time.perf_counter()
+        try:
+            await super()._run_event(coro, event_name, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            handler = getattr(coro, "__qualname__", repr(coro))
+            metrics.EVENT_DURATION.labels(event_name, handler).observe(elapsed)
+            profiler.handlers.record(f"{event_name}:{handler}", elapsed)
+
+    def _collect_metrics(self) -> None:
+        metrics.OUTBOUND_QUEUE_DEPTH.set(self.outbound.depth)
+        for source, seconds in scheduler.current_intervals().items():
+            metrics.POLL_INTERVAL.labels(source).set(seconds)
+        for host, state in self.http_client.circuit_states().items():
+            metrics.HTTP_CIRCUIT_STATE.labels(host).set(
+                metrics.CIRCUIT_STATE_VALUES[state]
+            )
+
+    async def on_connect(self):
+        if not self._connected_once:
+            self._connected_once = True
+            self._log_phase("gateway connect")
+
     async def on_ready(self):
+        if not self._ready_once:
+            self._ready_once = True
+            self._log_phase("ready")
+            if self._lazy_extensions:
+                self.spawn(self._load_lazy_extensions(), name="lazy-extensions")
         logger.info(f"Logged in as {self.user}")
 
 
 async def main():
     bot = Pururin()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, bot.request_shutdown)
+        except NotImplementedError:  # Windows
+            pass
     try:
         await bot.start(os.getenv("TOKEN"))  # type: ignore
     except KeyboardInterrupt:
@@ -77,10 +368,13 @@ async def main():
     except discord.LoginFailure:
         logger.error("Invalid token")
     finally:
-        await bot.close()
+        await bot.shutdown()
 
 
-try:
-    asyncio.run(main())
-except KeyboardInterrupt:
-    pass
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mylogger.shutdown()
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import sys
+import discord
+import metrics
+import mylogger
+import utils
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = mylogger.getLogger(__name__)
+
+# "full" caches members as discord.py does by default; "lean" caches none,
+# which is all OnMember and the feeds need.
+MEMORY_MODE = os.getenv("MEMORY_MODE", "full").lower()
+REPORT_SECONDS = float(os.getenv("MEMORY_REPORT_SECONDS", "900"))
+
+
+def member_cache_flags(intents: discord.Intents) -> discord.MemberCacheFlags:
+    if MEMORY_MODE == "lean":
+        return discord.MemberCacheFlags.none()
+    if MEMORY_MODE != "full":
+        logger.warning(f"Unknown MEMORY_MODE {MEMORY_MODE!r}, using full")
+    return discord.MemberCacheFlags.from_intents(intents)
+
+
+def rss_bytes() -> int | None:
+    """Current resident set size, or peak RSS where only that is known."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def discord_cache_sizes(bot: discord.Client) -> dict[str, int]:
+    return {
+        "guilds": len(bot.guilds),
+        "members": sum(len(g.members) for g in bot.guilds),
+        "users": len(bot.users),
+        "channels": sum(len(g.channels) for g in bot.guilds),
+    }
+
+
+def mib(size: float) -> str:
+    return f"{size / 1024 / 1024:.1f} MiB"
+
+
+class MemoryReporter:
+    """Logs RSS and cache sizes every ``interval`` seconds."""
+
+    def __init__(self, bot: discord.Client, interval: float = REPORT_SECONDS):
+        self.bot = bot
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run(), name="memory-report")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def collect(self) -> None:
+        """Metrics collector for RSS and cache sizes."""
+        rss = rss_bytes()
+        if rss is not None:
+            metrics.PROCESS_RSS.set(rss)
+        for name, (entries, size) in utils.cache_budget.usage().items():
+            metrics.CACHE_ENTRIES.labels(name).set(entries)
+            metrics.CACHE_BYTES.labels(name).set(size)
+        for name, count in discord_cache_sizes(self.bot).items():
+            metrics.DISCORD_CACHE_ENTRIES.labels(name).set(count)
+
+    def report(self) -> str:
+        rss = rss_bytes()
+        budget = utils.cache_budget
+        caches = ", ".join(
+            f"{name} {entries} ({size / 1024:.0f} KiB)"
+            for name, (entries, size) in sorted(budget.usage().items())
+        )
+        discord_caches = ", ".join(
+            f"{count} {name}" for name, count in discord_cache_sizes(self.bot).items()
+        )
+        return (
+            f"RSS {mib(rss) if rss is not None else 'unknown'} ({MEMORY_MODE} mode); "
+            f"caches {mib(budget.used)} of {mib(budget.max_bytes)}: {caches}; "
+            f"discord: {discord_caches}"
+        )
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            logger.info(f"Memory: {self.report()}")
@@ -0,0 +1,291 @@
+import abc
+import bisect
+import math
+from typing import Callable
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LAG_BUCKETS = (1, 5, 10, 15, 30, 60, 120, 300, 600, 1800, 3600)
+JOIN_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """A fresh value for one combination of label values."""
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child) -> list[str]:
+        labels = _format_labels(self.labelnames, key)
+        return [f"{self.name}{labels} {_format_value(child.value)}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def _render_child(self, key, child) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(child.buckets, child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{labels} {child.count}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Run ``collector`` before each scrape, e.g. to refresh gauges."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames=()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))  # type: ignore
+
+
+def gauge(name: str, documentation: str, labelnames=()) -> Gauge:
+    return registry.register(Gauge(name, documentation, labelnames))  # type: ignore
+
+
+def histogram(
+    name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))  # type: ignore
+
+
+HTTP_REQUEST_DURATION = histogram(
+    "pururin_http_request_duration_seconds",
+    "Latency of upstream HTTP requests.",
+    ("host",),
+)
+HTTP_REQUESTS = counter(
+    "pururin_http_requests_total",
+    "Upstream HTTP requests by status code (error when no response).",
+    ("host", "status"),
+)
+FEED_POLLS = counter(
+    "pururin_feed_polls_total",
+    "Feed poll outcomes: new, none, filtered or error.",
+    ("feed", "outcome"),
+)
+FEED_POST_LAG = histogram(
+    "pururin_feed_post_lag_seconds",
+    "Time from an upstream item being created to it being posted.",
+    ("feed",),
+    LAG_BUCKETS,
+)
+WEBHOOK_SEND_DURATION = histogram(
+    "pururin_webhook_send_duration_seconds",
+    "Latency of webhook executions.",
+)
+EVENT_DURATION = histogram(
+    "pururin_event_handler_duration_seconds",
+    "Duration of Discord event handlers.",
+    ("event", "handler"),
+)
+TASK_DURATION = histogram(
+    "pururin_task_loop_duration_seconds",
+    "Duration of each tasks.loop iteration.",
+    ("loop",),
+)
+LOOP_LAG = histogram(
+    "pururin_event_loop_lag_seconds",
+    "How late the event loop wakes a sleeping task.",
+)
+OUTBOUND_QUEUE_DEPTH = gauge(
+    "pururin_outbound_queue_depth",
+    "Discord sends waiting in the outbound dispatcher.",
+)
+OUTBOUND_WAIT = histogram(
+    "pururin_outbound_wait_seconds",
+    "Time from a Discord send being queued to it being sent.",
+    ("priority",),
+    WAIT_BUCKETS,
+)
+JOIN_ROLE_LATENCY = histogram(
+    "pururin_join_role_latency_seconds",
+    "Time from a member joining to their auto-role being assigned.",
+    buckets=JOIN_BUCKETS,
+)
+JOIN_QUEUE_DEPTH = gauge(
+    "pururin_join_queue_depth",
+    "Joined members waiting for their auto-role.",
+)
+PROCESS_RSS = gauge(
+    "pururin_process_resident_memory_bytes",
+    "Resident set size of the bot process.",
+)
+CACHE_BYTES = gauge(
+    "pururin_cache_bytes",
+    "Approximate bytes held by each budgeted cache.",
+    ("cache",),
+)
+CACHE_ENTRIES = gauge(
+    "pururin_cache_entries",
+    "Entries held by each budgeted cache.",
+    ("cache",),
+)
+DISCORD_CACHE_ENTRIES = gauge(
+    "pururin_discord_cache_entries",
+    "Guilds, members, users and channels in discord.py's cache.",
+    ("kind",),
+)
+POLL_INTERVAL = gauge(
+    "pururin_poll_interval_seconds",
+    "Current adaptive polling interval per source.",
+    ("source",),
+)
+
+HTTP_CIRCUIT_STATE = gauge(
+    "pururin_http_circuit_state",
+    "Circuit breaker state per upstream host: 0 closed, 1 half-open, 2 open.",
+    ("host",),
+)
+
+CIRCUIT_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def record_http(host: str, method: str, status: int | None, elapsed: float) -> None:
+    """HTTPClient hook recording request latency and status codes."""
+    HTTP_REQUEST_DURATION.labels(host).observe(elapsed)
+    HTTP_REQUESTS.labels(host, status if status is not None else "error").inc()
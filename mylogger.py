@@ -1,16 +1,117 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import time
 
-_handler = logging.StreamHandler()
-_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-)
-_handler.setLevel(logging.DEBUG)
+LOG_LEVEL = logging.getLevelName(os.getenv("LOG_LEVEL", "DEBUG").upper())
+if not isinstance(LOG_LEVEL, int):
+    LOG_LEVEL = logging.DEBUG
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+# Identical warnings/errors from one logger beyond this many per window are
+# dropped, and the count of dropped records is appended to the next one.
+RATE_LIMIT_BURST = int(os.getenv("LOG_RATE_LIMIT_BURST", "5"))
+RATE_LIMIT_WINDOW = float(os.getenv("LOG_RATE_LIMIT_WINDOW", "60"))
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            payload["stack_info"] = record.stack_info
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Drop repeats of the same WARNING+ message from a logger."""
+
+    def __init__(self, burst: int = RATE_LIMIT_BURST, window: float = RATE_LIMIT_WINDOW):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._seen: dict[tuple[str, int, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.burst <= 0:
+            return True
+
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        entry = self._seen.get(key)
+        if entry is None or now - entry[0] > self.window:
+            suppressed = entry[2] if entry else 0
+            self._seen[key] = [now, 1, 0]
+            if len(self._seen) > 1024:
+                self._prune(now)
+            if suppressed:
+                record.msg = f"{record.msg} (suppressed {suppressed} similar messages)"
+            return True
+
+        entry[1] += 1
+        if entry[1] <= self.burst:
+            return True
+        entry[2] += 1
+        return False
+
+    def _prune(self, now: float) -> None:
+        for key in [k for k, v in self._seen.items() if now - v[0] > self.window]:
+            del self._seen[key]
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only snapshot the message; formatting and tracebacks are rendered
+        # by the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_formatter: logging.Formatter
+if LOG_FORMAT == "json":
+    _formatter = JSONFormatter()
+else:
+    _formatter = logging.Formatter(
+        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(_formatter)
+
+_queue: queue.SimpleQueue = queue.SimpleQueue()
+_listener = logging.handlers.QueueListener(_queue, _stream_handler)
+_listener.start()
+
+_handler = _QueueHandler(_queue)
+_handler.setLevel(LOG_LEVEL)
+_handler.addFilter(RateLimitFilter())
 
 
 def getLogger(name: str) -> logging.Logger:
     logger = logging.getLogger(name)
     if not logger.handlers:
         logger.addHandler(_handler)
-        logger.setLevel(logging.DEBUG)
+        logger.setLevel(LOG_LEVEL)
         logger.propagate = False
     return logger
+
+
+def shutdown() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown)
@@ -0,0 +1,171 @@
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+import metrics
+import mylogger
+
+logger = mylogger.getLogger(__name__)
+
+LAG_SAMPLE_SECONDS = 0.25
+LAG_WINDOW = 2400  # ten minutes of samples
+# A stall this long gets the loop thread's stack logged by the watchdog.
+STALL_WARN_SECONDS = float(os.getenv("LOOP_STALL_WARN", "0.5"))
+# Handlers and loop iterations taking longer than this (awaits included)
+# are logged.
+SLOW_HANDLER_SECONDS = float(os.getenv("SLOW_HANDLER_WARN", "5"))
+
+
+def percentile(values: list[float], q: float) -> float:
+    """The ``q`` quantile (0-1) of already sorted ``values``."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class HandlerStats:
+    """Call count and time spent per event handler or task loop."""
+
+    __slots__ = ("count", "total", "max", "slow")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+
+
+class HandlerProfile:
+    """Running totals of how long each listener and loop takes."""
+
+    def __init__(self, slow_after: float = SLOW_HANDLER_SECONDS):
+        self.slow_after = slow_after
+        self._stats: dict[str, HandlerStats] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = HandlerStats()
+        stats.count += 1
+        stats.total += seconds
+        stats.max = max(stats.max, seconds)
+        if seconds >= self.slow_after:
+            stats.slow += 1
+            logger.warning(f"Slow handler {name} took {seconds:.2f}s")
+
+    def top(self, n: int = 10) -> list[tuple[str, HandlerStats]]:
+        """The ``n`` handlers with the most total time."""
+        ranked = sorted(self._stats.items(), key=lambda i: i[1].total, reverse=True)
+        return ranked[:n]
+
+
+class LagMonitor:
+    """Samples event-loop lag and reports what is blocking the loop.
+
+    A task sleeps for ``interval`` and records how late it wakes up. A
+    watchdog thread notices when those wake-ups stop and logs the loop
+    thread's stack while it is still stuck, which names the blocking call.
+    """
+
+    def __init__(
+        self,
+        interval: float = LAG_SAMPLE_SECONDS,
+        stall_after: float = STALL_WARN_SECONDS,
+        window: int = LAG_WINDOW,
+    ):
+        self.interval = interval
+        self.stall_after = stall_after
+        self.samples: deque[float] = deque(maxlen=window)
+        self._beat = time.monotonic()
+        self._reported_beat = 0.0
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self._loop_thread_id = 0
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._beat = time.monotonic()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._sample(), name="loop-lag")
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._thread = None
+
+    def percentiles(self) -> dict[str, float]:
+        values = sorted(self.samples)
+        return {
+            "p50": percentile(values, 0.5),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+            "max": values[-1] if values else 0.0,
+        }
+
+    async def _sample(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            lag = max(0.0, now - expected)
+            self.samples.append(lag)
+            metrics.LOOP_LAG.observe(lag)
+
+    def _watch(self) -> None:
+        limit = self.interval + self.stall_after
+        while not self._stopped.wait(self.stall_after / 2):
+            beat = self._beat
+            stalled = time.monotonic() - beat
+            if stalled < limit or beat == self._reported_beat:
+                continue
+            # One report per stall.
+            self._reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "unknown"
+            logger.warning(
+                f"Event loop blocked for {stalled - self.interval:.2f}s, at:\n{stack}"
+            )
+
+
+def timed(func):
+    """Record each run of a ``tasks.loop`` coroutine in :data:`handlers`.
+
+    Apply below ``@tasks.loop`` so the loop wraps the timed coroutine.
+    Iterations in progress are counted in :data:`in_flight`.
+    """
+    name = f"loop:{func.__qualname__}"
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        global in_flight
+        started = time.perf_counter()
+        in_flight += 1
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            in_flight -= 1
+            elapsed = time.perf_counter() - started
+            handlers.record(name, elapsed)
+            metrics.TASK_DURATION.labels(func.__qualname__).observe(elapsed)
+
+    return wrapper
+
+
+handlers = HandlerProfile()
+in_flight = 0
+lag_monitor = LagMonitor()
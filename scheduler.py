@@ -0,0 +1,66 @@
+import asyncio
+import os
+import random
+import mylogger
+
+logger = mylogger.getLogger(__name__)
+
+# Upper bound on upstream feed fetches in flight across every poller, so
+# adding sources raises latency gracefully instead of opening more sockets.
+# Pass it as HTTPClient.request(slots=...): slots are held only while a
+# request is on the wire, not while it waits on a host's rate limit.
+FETCH_CONCURRENCY = int(os.getenv("FEED_FETCH_CONCURRENCY", "8"))
+
+fetch_slots = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+
+class AdaptiveInterval:
+    """Polling interval that tightens on activity and backs off when idle.
+
+    After a poll that found something the interval drops to ``floor``; each
+    quiet poll multiplies it by ``backoff`` up to ``ceiling``. The returned
+    delay is spread by +/- ``jitter`` so sources do not poll in lockstep.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        floor: float,
+        ceiling: float,
+        backoff: float = 1.5,
+        jitter: float = 0.1,
+    ):
+        if floor <= 0 or ceiling < floor:
+            raise ValueError(f"Invalid interval bounds for {name}: {floor}-{ceiling}")
+        self.name = name
+        self.floor = floor
+        self.ceiling = ceiling
+        self.backoff = backoff
+        self.jitter = jitter
+        self.current = floor
+
+    def record(self, activity: bool) -> float:
+        """Update the interval after a poll and return the next delay."""
+        if activity:
+            self.current = self.floor
+        else:
+            self.current = min(self.ceiling, self.current * self.backoff)
+        spread = self.current * self.jitter
+        delay = self.current + random.uniform(-spread, spread)
+        return max(self.floor, min(self.ceiling, delay))
+
+
+_intervals: dict[str, AdaptiveInterval] = {}
+
+
+def register(name: str, floor: float, ceiling: float, **kwargs) -> AdaptiveInterval:
+    """Create (or replace) the adaptive interval for a polling source."""
+    interval = AdaptiveInterval(name, floor, ceiling, **kwargs)
+    _intervals[name] = interval
+    logger.info(f"Polling {name} every {floor:g}-{ceiling:g}s")
+    return interval
+
+
+def current_intervals() -> dict[str, float]:
+    """Current base interval of every registered source, in seconds."""
+    return {name: interval.current for name, interval in _intervals.items()}
@@ -0,0 +1,330 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import mylogger
+import utils
+
+logger = mylogger.getLogger(__name__)
+
+DB_FILE = "pururin.db"
+
+
+class Database:
+    """SQLite connection whose queries run on a worker thread."""
+
+    def __init__(self, filename: str = DB_FILE):
+        self.filename = filename
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(
+                utils.data_path(self.filename), check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn = conn
+        return self._conn
+
+    def _run(self, sql: str, params, many: bool) -> list[tuple]:
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                if many:
+                    conn.executemany(sql, params)
+                    return []
+                return conn.execute(sql, params).fetchall()
+
+    async def execute(self, sql: str, params=()) -> list[tuple]:
+        return await asyncio.to_thread(self._run, sql, params, False)
+
+    async def executemany(self, sql: str, params) -> None:
+        await asyncio.to_thread(self._run, sql, list(params), True)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class PostedIndex:
+    """Persistent record of feed items that have already been posted.
+
+    Lookups hit a bounded in-memory LRU first and fall back to SQLite.
+    Entries older than ``retention`` seconds are evicted.
+    """
+
+    def __init__(
+        self, db: Database, maxsize: int = 4096, retention: float = 30 * 86400
+    ):
+        self.db = db
+        self.maxsize = maxsize
+        self.retention = retention
+        self._recent: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._warm: set[str] = set()
+        self._ready = False
+        self._evicted_at = 0.0
+
+    async def _setup(self) -> None:
+        if self._ready:
+            return
+        await self.db.execute(
+            "CREATE TABLE IF NOT EXISTS posted ("
+            "feed TEXT NOT NULL, key TEXT NOT NULL, posted_at REAL NOT NULL, "
+            "PRIMARY KEY (feed, key))"
+        )
+        await self.db.execute(
+            "CREATE INDEX IF NOT EXISTS posted_at_idx ON posted (posted_at)"
+        )
+        self._ready = True
+
+    def _remember(self, feed: str, key: str, posted_at: float) -> None:
+        self._recent[(feed, key)] = posted_at
+        self._recent.move_to_end((feed, key))
+        while len(self._recent) > self.maxsize:
+            self._recent.popitem(last=False)
+
+    async def contains(self, feed: str, key: str) -> bool:
+        if (feed, key) in self._recent:
+            self._recent.move_to_end((feed, key))
+            return True
+        await self._setup()
+        rows = await self.db.execute(
+            "SELECT posted_at FROM posted WHERE feed = ? AND key = ? "
+            "AND posted_at >= ?",
+            (feed, key, time.time() - self.retention),
+        )
+        if rows:
+            self._remember(feed, key, rows[0][0])
+            return True
+        return False
+
+    async def add(self, feed: str, key: str) -> None:
+        now = time.time()
+        self._remember(feed, key, now)
+        self._warm.add(feed)
+        await self._setup()
+        await self.db.execute(
+            "INSERT OR REPLACE INTO posted (feed, key, posted_at) VALUES (?, ?, ?)",
+            (feed, key, now),
+        )
+        if now - self._evicted_at > 3600:
+            self._evicted_at = now
+            await self.db.execute(
+                "DELETE FROM posted WHERE posted_at < ?", (now - self.retention,)
+            )
+
+    async def is_cold(self, feed: str) -> bool:
+        """Whether nothing is recorded for ``feed`` yet (e.g. first run)."""
+        if feed in self._warm:
+            return False
+        await self._setup()
+        rows = await self.db.execute(
+            "SELECT 1 FROM posted WHERE feed = ? LIMIT 1", (feed,)
+        )
+        if rows:
+            self._warm.add(feed)
+            return False
+        return True
+
+
+class StateStore:
+    """Key/value store for cursors with write-behind persistence.
+
+    Reads are served from memory once :meth:`load` has run. Writes update
+    memory immediately and are flushed to SQLite in a single transaction
+    shortly afterwards, off the event loop.
+    """
+
+    def __init__(self, db: Database, flush_delay: float = 2.0):
+        self.db = db
+        self.flush_delay = flush_delay
+        self._values: dict[str, object] = {}
+        self._dirty: set[str] = set()
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+
+    async def load(self) -> None:
+        async with self._load_lock:
+            if self._loaded:
+                return
+            await self.db.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            rows = await self.db.execute("SELECT key, value FROM state")
+            for key, value in rows:
+                self._values.setdefault(key, json.loads(value))
+            self._loaded = True
+
+    async def refresh(self) -> None:
+        """Re-read values another process may have written, keeping ours."""
+        await self.load()
+        rows = await self.db.execute("SELECT key, value FROM state")
+        for key, value in rows:
+            if key not in self._dirty:
+                self._values[key] = json.loads(value)
+
+    def get(self, key: str, default=None):
+        return self._values.get(key, default)
+
+    def set(self, key: str, value) -> None:
+        self._values[key] = value
+        self._dirty.add(key)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Persist every pending change now."""
+        if not self._dirty:
+            return
+        await self.load()
+        dirty, self._dirty = self._dirty, set()
+        now = time.time()
+        rows = [(key, json.dumps(self._values[key]), now) for key in dirty]
+        try:
+            await self.db.executemany(
+                "INSERT OR REPLACE INTO state (key, value, updated_at) VALUES (?, ?, ?)",
+                rows,
+            )
+        except Exception as e:
+            self._dirty |= dirty
+            logger.error(f"Failed to persist state: {e}")
+
+
+class Subscription:
+    """One channel's subscription to a feed source."""
+
+    __slots__ = ("id", "kind", "source", "channel_id", "webhook", "filters")
+
+    def __init__(
+        self,
+        id: int,
+        kind: str,
+        source: str,
+        channel_id: int,
+        webhook: str,
+        filters: dict,
+    ):
+        self.id = id
+        self.kind = kind
+        self.source = source
+        self.channel_id = channel_id
+        self.webhook = webhook
+        self.filters = filters
+
+    @property
+    def feed(self) -> str:
+        """Posted-index namespace for this subscription."""
+        return f"{self.kind}:{self.source}:{self.channel_id}"
+
+
+class SubscriptionStore:
+    """Feed subscriptions mapping each source to any number of channels.
+
+    Every subscription is held in memory after :meth:`load`, so pollers can
+    group them by source each cycle without touching SQLite.
+    """
+
+    def __init__(self, db: Database, refresh_after: float = 30.0):
+        self.db = db
+        self.refresh_after = refresh_after
+        self._subs: dict[int, Subscription] = {}
+        self._loaded_at: float | None = None
+        self._load_lock = asyncio.Lock()
+
+    async def load(self, max_age: float | None = None) -> None:
+        """Read subscriptions once, or again if older than ``max_age``.
+
+        Reloading picks up changes made by other processes.
+        """
+        async with self._load_lock:
+            if self._loaded_at is not None and (
+                max_age is None or time.monotonic() - self._loaded_at < max_age
+            ):
+                return
+            await self.db.execute(
+                "CREATE TABLE IF NOT EXISTS subscriptions ("
+                "id INTEGER PRIMARY KEY, kind TEXT NOT NULL, source TEXT NOT NULL, "
+                "channel_id INTEGER NOT NULL, webhook TEXT NOT NULL, "
+                "filters TEXT NOT NULL, created_at REAL NOT NULL, "
+                "UNIQUE (kind, source, channel_id))"
+            )
+            rows = await self.db.execute(
+                "SELECT id, kind, source, channel_id, webhook, filters "
+                "FROM subscriptions"
+            )
+            self._subs = {
+                id: Subscription(
+                    id, kind, source, channel_id, webhook, json.loads(filters)
+                )
+                for id, kind, source, channel_id, webhook, filters in rows
+            }
+            self._loaded_at = time.monotonic()
+
+    async def refresh(self) -> None:
+        """Reload if the in-memory copy is older than ``refresh_after``."""
+        await self.load(max_age=self.refresh_after)
+
+    def by_source(self, kind: str) -> dict[str, list[Subscription]]:
+        """Group the subscriptions of one kind by the source they follow."""
+        sources: dict[str, list[Subscription]] = {}
+        for sub in self._subs.values():
+            if sub.kind == kind:
+                sources.setdefault(sub.source, []).append(sub)
+        return sources
+
+    def for_channels(self, channel_ids) -> list[Subscription]:
+        channel_ids = set(channel_ids)
+        return [s for s in self._subs.values() if s.channel_id in channel_ids]
+
+    def get(self, kind: str, source: str, channel_id: int) -> Subscription | None:
+        for sub in self._subs.values():
+            if (sub.kind, sub.source, sub.channel_id) == (kind, source, channel_id):
+                return sub
+        return None
+
+    def count(self, kind: str) -> int:
+        return sum(1 for s in self._subs.values() if s.kind == kind)
+
+    async def add(
+        self, kind: str, source: str, channel_id: int, webhook: str, filters: dict
+    ) -> Subscription:
+        """Create a subscription, or replace the filters of an existing one."""
+        await self.load()
+        await self.db.execute(
+            "INSERT INTO subscriptions "
+            "(kind, source, channel_id, webhook, filters, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (kind, source, channel_id) DO UPDATE SET "
+            "webhook = excluded.webhook, filters = excluded.filters",
+            (kind, source, channel_id, webhook, json.dumps(filters), time.time()),
+        )
+        rows = await self.db.execute(
+            "SELECT id FROM subscriptions "
+            "WHERE kind = ? AND source = ? AND channel_id = ?",
+            (kind, source, channel_id),
+        )
+        sub = Subscription(rows[0][0], kind, source, channel_id, webhook, filters)
+        self._subs[sub.id] = sub
+        return sub
+
+    async def remove(self, sub: Subscription) -> None:
+        await self.db.execute("DELETE FROM subscriptions WHERE id = ?", (sub.id,))
+        self._subs.pop(sub.id, None)
+
+
+db = Database()
+posted_index = PostedIndex(db)
+state_store = StateStore(db)
+subscriptions = SubscriptionStore(db)
@@ -1,11 +1,130 @@
+import asyncio
+import json
 import os
+import sys
+import time
+from collections import OrderedDict
 import discord
 from discord.ext import commands
-import aiohttp
 import mylogger
+import storage
 
 logger = mylogger.getLogger(__name__)
 
+DATA_DIR = os.getenv("DATA_DIR", "data")
+# Shared by every named TTLCache; see CacheBudget.
+CACHE_BUDGET_BYTES = int(float(os.getenv("CACHE_BUDGET_MB", "16")) * 1024 * 1024)
+# Messages scanned for earlier posts on a cold start. The outbound dispatcher
+# packs up to ten embeds into one webhook message, so this covers a few
+# hundred items in a single history request.
+HISTORY_SCAN_LIMIT = 50
+
+
+def data_path(name: str) -> str:
+    """Return the path of a file in the bot's data directory."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, name)
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Write ``data`` to ``path`` so readers never see a partial file."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class WebhookRegistry:
+    """Process-wide cache of webhooks keyed by (channel id, webhook name).
+
+    Webhook URLs are persisted so a restart does not need to list the
+    channel's webhooks again. Entries are only dropped when Discord reports
+    the webhook as unknown.
+    """
+
+    def __init__(self, filename: str = "webhooks.json"):
+        self.filename = filename
+        self._webhooks: dict[tuple[int, str], discord.Webhook] = {}
+        self._urls: dict[str, str] | None = None
+        self._locks: dict[tuple[int, str], asyncio.Lock] = {}
+
+    async def get(self, channel: discord.abc.Messageable, name: str) -> discord.Webhook:
+        key = (channel.id, name)  # type: ignore
+        webhook = self._webhooks.get(key)
+        if webhook is not None:
+            return webhook
+
+        # Only one caller per key performs the lookup; the rest wait for it.
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            webhook = self._webhooks.get(key)
+            if webhook is not None:
+                return webhook
+
+            urls = await self._load()
+            url = urls.get(self._url_key(key))
+            if url:
+                client = channel._state._get_client()  # type: ignore
+                webhook = discord.Webhook.from_url(url, client=client)
+            else:
+                webhook = await WebhookHelper.fetch_or_create_webhook(channel, name)
+                if webhook.token:
+                    urls[self._url_key(key)] = webhook.url
+                    await self._save()
+
+            self._webhooks[key] = webhook
+            return webhook
+
+    async def invalidate(
+        self, channel: discord.abc.Messageable, name: str, webhook: discord.Webhook
+    ) -> None:
+        """Forget ``webhook`` if it is still the cached entry for the key."""
+        key = (channel.id, name)  # type: ignore
+        if self._webhooks.get(key) is not webhook:
+            return
+        del self._webhooks[key]
+        urls = await self._load()
+        if urls.pop(self._url_key(key), None) is not None:
+            await self._save()
+        logger.info(f"Invalidated webhook '{name}' in {channel}")
+
+    async def send(self, channel: discord.abc.Messageable, name: str, **kwargs):
+        webhook = await self.get(channel, name)
+        try:
+            return await webhook.send(**kwargs)
+        except discord.NotFound:
+            await self.invalidate(channel, name, webhook)
+            webhook = await self.get(channel, name)
+            return await webhook.send(**kwargs)
+
+    @staticmethod
+    def _url_key(key: tuple[int, str]) -> str:
+        return f"{key[0]}:{key[1]}"
+
+    async def _load(self) -> dict[str, str]:
+        if self._urls is None:
+            try:
+                self._urls = await asyncio.to_thread(self._read)
+            except FileNotFoundError:
+                self._urls = {}
+            except Exception as e:
+                logger.warning(f"Could not read {self.filename}: {e}")
+                self._urls = {}
+        return self._urls
+
+    async def _save(self) -> None:
+        data = json.dumps(self._urls).encode()
+        try:
+            await asyncio.to_thread(write_atomic, data_path(self.filename), data)
+        except Exception as e:
+            logger.warning(f"Could not write {self.filename}: {e}")
+
+    def _read(self) -> dict[str, str]:
+        with open(data_path(self.filename), "rb") as f:
+            return json.load(f)
+
 
 class WebhookHelper:
     """Helper class for managing Discord webhooks."""
@@ -14,39 +133,69 @@ class WebhookHelper:
     async def get_or_create_webhook(
         channel: discord.abc.Messageable, name: str
     ) -> discord.Webhook:
-        webhooks = await channel.webhooks()
+        return await webhook_registry.get(channel, name)
+
+    @staticmethod
+    async def send_via_webhook(
+        channel: discord.abc.Messageable, name: str, **kwargs
+    ):
+        """Send through the cached webhook, re-resolving it once if it is gone."""
+        return await webhook_registry.send(channel, name, **kwargs)
+
+    @staticmethod
+    async def fetch_or_create_webhook(
+        channel: discord.abc.Messageable, name: str
+    ) -> discord.Webhook:
+        webhooks = await channel.webhooks()  # type: ignore
         webhook = discord.utils.get(webhooks, name=name)
         if not webhook:
-            webhook = await channel.create_webhook(name=name)
+            webhook = await channel.create_webhook(name=name)  # type: ignore
             logger.info(f"Created webhook '{name}' in {channel}")
         return webhook
 
     @staticmethod
     async def should_post_via_webhook(
-        channel: discord.abc.Messageable, webhook: discord.Webhook, embed: discord.Embed
+        channel: discord.abc.Messageable,
+        webhook: discord.Webhook,
+        embed: discord.Embed,
+        feed: str,
+        key: str | None = None,
+        recent: set[str] | None = None,
     ) -> bool:
-        history = [msg async for msg in channel.history(limit=10)]
-        for msg in history:
-            if msg.webhook_id == webhook.id and msg.embeds:
-                if msg.embeds[0].url == embed.url:
-                    return False
-        return True
-
-
-class SessionManager:
-    """Manager for aiohttp session reuse."""
+        """Check the posted index, scanning history only on a cold start.
 
-    def __init__(self):
-        self._session: aiohttp.ClientSession | None = None
+        Callers checking several items pass ``recent`` from
+        :meth:`recent_urls` so the history is scanned once for all of them.
+        """
+        key = key or embed.url
+        if key and await storage.posted_index.contains(feed, key):
+            return False
+        if recent is None:
+            if not await storage.posted_index.is_cold(feed):
+                return True
+            recent = await WebhookHelper.recent_urls(channel, webhook)
+        if embed.url in recent:
+            if key:
+                await storage.posted_index.add(feed, key)
+            return False
+        return True
 
-    async def get_session(self) -> aiohttp.ClientSession:
-        if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession()
-        return self._session
+    @staticmethod
+    async def recent_urls(
+        channel: discord.abc.Messageable, webhook: discord.Webhook
+    ) -> set[str]:
+        """Embed URLs of the webhook's posts among the channel's latest messages."""
+        return {
+            e.url
+            async for msg in channel.history(limit=HISTORY_SCAN_LIMIT)
+            if msg.webhook_id == webhook.id
+            for e in msg.embeds
+            if e.url
+        }
 
-    async def close(self) -> None:
-        if self._session and not self._session.closed:
-            await self._session.close()
+    @staticmethod
+    async def mark_posted(feed: str, key: str) -> None:
+        await storage.posted_index.add(feed, key)
 
 
 def truncate_text(text: str, limit: int = 500) -> str:
@@ -59,3 +208,126 @@ def truncate_text(text: str, limit: int = 500) -> str:
     if " " in truncated:
         truncated = truncated.rsplit(" ", 1)[0]
     return truncated + "..."
+
+
+def approx_size(value) -> int:
+    """Rough size of ``value`` in bytes, counting one level of containers."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, list, set, frozenset)):
+        size += sum(sys.getsizeof(v) for v in value)
+    elif isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    return size
+
+
+class CacheBudget:
+    """Byte budget shared by the bot's named caches.
+
+    When the caches together hold more than ``max_bytes``, the largest one
+    drops its least recently used entries until they fit again.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._caches: dict[str, "TTLCache"] = {}
+
+    def register(self, name: str, cache: "TTLCache") -> None:
+        # A reloaded extension replaces its old cache of the same name.
+        old = self._caches.get(name)
+        if old is not None and old is not cache:
+            self.used -= old.bytes
+            old.budget = None
+        self._caches[name] = cache
+
+    def charge(self, delta: int) -> None:
+        self.used += delta
+        while self.used > self.max_bytes:
+            largest = max(self._caches.values(), key=lambda c: c.bytes)
+            if not largest.evict_oldest():
+                break
+
+    def usage(self) -> dict[str, tuple[int, int]]:
+        """Map each cache name to (entries, approximate bytes)."""
+        return {name: (len(c), c.bytes) for name, c in self._caches.items()}
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire after ``ttl`` seconds.
+
+    Expired entries are kept until evicted so ``get(..., stale=True)`` can
+    still serve them while their source is unavailable. Caches given a
+    ``name`` also count against the shared :data:`cache_budget`.
+    """
+
+    def __init__(
+        self, maxsize: int = 1024, ttl: float = 300.0, name: str | None = None
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.bytes = 0
+        self.budget: CacheBudget | None = None
+        self._data: OrderedDict = OrderedDict()
+        if name is not None:
+            self.budget = cache_budget
+            cache_budget.register(name, self)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, MISSING) is not MISSING
+
+    def get(self, key, default=None, stale: bool = False):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires, value, _ = entry
+        if expires < time.monotonic() and not stale:
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float | None = None) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        size = approx_size(key) + approx_size(value) if self.budget else 0
+        old = self._data.get(key)
+        self._data[key] = (expires, value, size)
+        self._data.move_to_end(key)
+        self._account(size - (old[2] if old else 0))
+        while len(self._data) > self.maxsize:
+            self.evict_oldest()
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        self._account(-entry[2])
+        return entry[1]
+
+    def evict_oldest(self) -> bool:
+        """Drop the least recently used entry; False if there was none."""
+        if not self._data:
+            return False
+        _, (_, _, size) = self._data.popitem(last=False)
+        self._account(-size)
+        return True
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._account(-self.bytes)
+
+    def _account(self, delta: int) -> None:
+        if not delta:
+            return
+        self.bytes += delta
+        if self.budget is not None:
+            self.budget.charge(delta)
+
+
+MISSING = object()
+
+cache_budget = CacheBudget(CACHE_BUDGET_BYTES)
+
+webhook_registry = WebhookRegistry()
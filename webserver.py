@@ -1,46 +1,128 @@
+import datetime
+import inspect
+import math
 import os
-import traceback
-from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-import threading
+import time
+from aiohttp import web
+from discord.ext import commands, tasks
+import metrics
+import mylogger
 
+logger = mylogger.getLogger(__name__)
 
-class Handler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        try:
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(b"OK")
-        except Exception:
-            traceback.print_exc()
+MAX_LATENCY_SECONDS = float(os.getenv("HEALTH_MAX_LATENCY", "10"))
+LOOP_GRACE_SECONDS = float(os.getenv("HEALTH_LOOP_GRACE", "120"))
+UNREADY_GRACE_SECONDS = float(os.getenv("HEALTH_UNREADY_GRACE", "600"))
 
-    def do_HEAD(self):
-        try:
-            self.send_response(200)
-            self.end_headers()
-        except Exception:
-            traceback.print_exc()
 
-    def log_message(self, format, *args):
-        pass
+def iter_loops(bot: commands.Bot):
+    """Yield (name, loop) for every tasks.loop defined on a loaded cog."""
+    for cog_name, cog in bot.cogs.items():
+        for attr, value in inspect.getmembers(type(cog)):
+            if isinstance(value, tasks.Loop):
+                yield f"{cog_name}.{attr}", getattr(cog, attr)
 
 
-def start_web_server():
-    port = int(os.environ.get("PORT", 10000))
-    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
-    print(f"Listening on 0.0.0.0:{port}", flush=True)
+class HealthServer:
+    """Liveness and readiness endpoints served from the bot's event loop.
 
-    try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        pass
-    except Exception:
-        traceback.print_exc()
+    ``/livez`` fails only when the bot looks wedged: a task loop crashed,
+    or the gateway has not been ready for ``UNREADY_GRACE_SECONDS``.
+    ``/readyz`` additionally requires a connected gateway with sane
+    latency and every task loop to be on schedule.
+    """
 
+    def __init__(self, bot: commands.Bot, host: str = "0.0.0.0", port: int | None = None):
+        self.bot = bot
+        self.host = host
+        self.port = port or int(os.environ.get("PORT", 10000))
+        self.app = web.Application()
+        self.app.router.add_route("*", "/", self.handle_root)
+        self.app.router.add_get("/livez", self.handle_livez)
+        self.app.router.add_get("/readyz", self.handle_readyz)
+        self.app.router.add_get("/metrics", self.handle_metrics)
+        self._runner: web.AppRunner | None = None
+        self._unready_since: float | None = time.monotonic()
 
-def start_web_server_in_thread():
-    t = threading.Thread(target=start_web_server, daemon=True)
-    t.start()
-    return t
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        logger.info(f"Health server listening on {self.host}:{self.port}")
 
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
 
-start_web_server_in_thread()
+    def loop_status(self) -> dict[str, dict]:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        status = {}
+        for name, loop in iter_loops(self.bot):
+            next_iteration = loop.next_iteration
+            overdue = (
+                (now - next_iteration).total_seconds() if next_iteration else 0.0
+            )
+            status[name] = {
+                "running": loop.is_running(),
+                "failed": loop.failed(),
+                "overdue": max(0.0, overdue),
+                "fresh": not loop.failed() and overdue < LOOP_GRACE_SECONDS,
+            }
+        return status
+
+    def check(self) -> tuple[bool, bool, dict]:
+        """Return (alive, ready, details)."""
+        latency = self.bot.latency
+        # is_ready() stays true and latency keeps its last value while the
+        # gateway is down, so ask each shard whether its socket is open.
+        shards = self.bot.shards.values()  # type: ignore
+        connected = (
+            self.bot.is_ready()
+            and not self.bot.is_closed()
+            and bool(shards)
+            and all(not shard.is_closed() for shard in shards)
+        )
+        latency_ok = math.isfinite(latency) and latency < MAX_LATENCY_SECONDS
+
+        now = time.monotonic()
+        if connected and latency_ok:
+            self._unready_since = None
+        elif self._unready_since is None:
+            self._unready_since = now
+
+        loops = self.loop_status()
+        loops_fresh = all(s["fresh"] for s in loops.values() if s["running"])
+        loops_failed = any(s["failed"] for s in loops.values())
+
+        unready_for = 0.0 if self._unready_since is None else now - self._unready_since
+        alive = not loops_failed and unready_for < UNREADY_GRACE_SECONDS
+        ready = connected and latency_ok and loops_fresh
+
+        details = {
+            "connected": connected,
+            "latency": latency if math.isfinite(latency) else None,
+            "unready_for": round(unready_for, 1),
+            "loops": loops,
+            "circuits": self.bot.http_client.circuit_states(),  # type: ignore
+        }
+        return alive, ready, details
+
+    async def handle_root(self, request: web.Request) -> web.Response:
+        return web.Response(text="OK")
+
+    async def handle_livez(self, request: web.Request) -> web.Response:
+        alive, _, details = self.check()
+        return web.json_response(details, status=200 if alive else 503)
+
+    async def handle_readyz(self, request: web.Request) -> web.Response:
+        _, ready, details = self.check()
+        return web.json_response(details, status=200 if ready else 503)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=metrics.registry.render(),
+            content_type="text/plain",
+            headers={"X-Content-Type-Options": "nosniff"},
+        )
@@ -0,0 +1,277 @@
+import asyncio
+import bisect
+import gzip
+import json
+import os
+import time
+import httpclient
+import mylogger
+import utils
+
+logger = mylogger.getLogger(__name__)
+
+INDEX_VERSION = 1
+MAX_REDIRECT_HOPS = 5
+
+
+def normalize_title(title: str) -> str:
+    """Normalize a title the way MediaWiki does for main-namespace lookups."""
+    title = " ".join(title.replace("_", " ").split())
+    return title[:1].upper() + title[1:]
+
+
+def fold(title: str) -> str:
+    return normalize_title(title).casefold()
+
+
+class TitleIndex:
+    """In-memory, case-insensitive index of main-namespace wiki titles.
+
+    ``_entries`` maps each normalized title to itself for articles and to its
+    target for redirects. ``_keys`` is a sorted list of case-folded titles
+    used for prefix search.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ready = False
+        self.built_at = 0.0
+        self.dirty = False
+        # mtime of the file as last loaded or saved by this process.
+        self.file_mtime: float | None = None
+        self._namespaces: set[str] = set()
+        self._entries: dict[str, str] = {}
+        self._folded: dict[str, str] = {}
+        self._keys: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _stat(self) -> float | None:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def changed_on_disk(self) -> bool:
+        """Whether another process has saved the index since we read it."""
+        mtime = self._stat()
+        return mtime is not None and mtime != self.file_mtime
+
+    def covers(self, title: str) -> bool:
+        """Whether a lookup of ``title`` can be answered locally."""
+        if not self.ready:
+            return False
+        prefix, sep, _ = title.partition(":")
+        return not sep or fold(prefix) not in self._namespaces
+
+    def lookup(self, title: str) -> str | None:
+        """Return the canonical page for ``title``, following redirects."""
+        name = normalize_title(title)
+        if name not in self._entries:
+            name = self._folded.get(name.casefold())
+            if name is None:
+                return None
+
+        for _ in range(MAX_REDIRECT_HOPS):
+            target = self._entries.get(name, name)
+            if target == name:
+                break
+            name = target
+        return name
+
+    def search(self, prefix: str, limit: int = 25) -> list[str]:
+        """Return up to ``limit`` titles starting with ``prefix``."""
+        key = prefix.strip().replace("_", " ").casefold()
+        results = []
+        i = bisect.bisect_left(self._keys, key)
+        while i < len(self._keys) and len(results) < limit:
+            folded = self._keys[i]
+            if not folded.startswith(key):
+                break
+            results.append(self._folded[folded])
+            i += 1
+        return results
+
+    def add(self, title: str, target: str | None = None) -> None:
+        name = normalize_title(title)
+        self._entries[name] = normalize_title(target) if target else name
+        folded = name.casefold()
+        if folded not in self._folded:
+            bisect.insort(self._keys, folded)
+        # Prefer an article over a redirect that differs only by case.
+        if folded not in self._folded or not target:
+            self._folded[folded] = name
+        self.dirty = True
+
+    def remove(self, title: str) -> None:
+        name = normalize_title(title)
+        if self._entries.pop(name, None) is None:
+            return
+        folded = name.casefold()
+        if self._folded.get(folded) == name:
+            alternatives = [t for t in self._entries if t.casefold() == folded]
+            if alternatives:
+                self._folded[folded] = alternatives[0]
+            else:
+                del self._folded[folded]
+                i = bisect.bisect_left(self._keys, folded)
+                if i < len(self._keys) and self._keys[i] == folded:
+                    del self._keys[i]
+        self.dirty = True
+
+    def apply_change(self, change: dict) -> None:
+        """Keep the index current from a recentchanges entry."""
+        title = change.get("title", "")
+        in_main = change.get("ns") == 0
+        kind = change.get("type")
+
+        if kind == "new" and in_main:
+            self.add(title)
+            return
+
+        if kind != "log":
+            return
+
+        logtype = change.get("logtype")
+        action = change.get("logaction")
+        params = change.get("logparams", {})
+
+        if logtype == "delete" and in_main:
+            if action == "delete":
+                self.remove(title)
+            elif action == "restore":
+                self.add(title)
+        elif logtype == "move":
+            target = params.get("target_title")
+            target_in_main = params.get("target_ns") == 0
+            if target and target_in_main:
+                self.add(target)
+            if in_main:
+                if "suppressredirect" in params or not target_in_main:
+                    self.remove(title)
+                else:
+                    self.add(title, target)
+
+    def _rebuild(self, entries: dict[str, str]) -> None:
+        self._entries = entries
+        self._folded = {}
+        for name, target in entries.items():
+            folded = name.casefold()
+            if folded not in self._folded or target == name:
+                self._folded[folded] = name
+        self._keys = sorted(self._folded)
+
+    async def load(self) -> bool:
+        """Load the persisted index; returns False if there is none to load."""
+        # Taken before reading, so a save racing the read is picked up by
+        # the next changed_on_disk() check; a file that fails to load is
+        # not retried until it changes.
+        self.file_mtime = self._stat()
+        try:
+            payload = await asyncio.to_thread(self._read)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Could not read wiki index {self.path}: {e}")
+            return False
+
+        if payload.get("version") != INDEX_VERSION:
+            return False
+
+        self._namespaces = set(payload.get("namespaces", []))
+        self._rebuild(payload.get("entries", {}))
+        self.built_at = payload.get("built_at", 0.0)
+        self.ready = True
+        self.dirty = False
+        logger.info(f"Loaded wiki index with {len(self)} titles")
+        return True
+
+    async def save(self) -> None:
+        payload = {
+            "version": INDEX_VERSION,
+            "built_at": self.built_at,
+            "namespaces": sorted(self._namespaces),
+            "entries": dict(self._entries),
+        }
+        self.dirty = False
+        try:
+            await asyncio.to_thread(self._write, payload)
+            self.file_mtime = self._stat()
+        except Exception as e:
+            self.dirty = True
+            logger.warning(f"Could not write wiki index {self.path}: {e}")
+
+    def _read(self) -> dict:
+        with gzip.open(self.path, "rb") as f:
+            return json.loads(f.read())
+
+    def _write(self, payload: dict) -> None:
+        data = json.dumps(payload, separators=(",", ":")).encode()
+        utils.write_atomic(self.path, gzip.compress(data))
+
+    async def bootstrap(self, http: httpclient.HTTPClient, api: str) -> None:
+        """Crawl every main-namespace title and redirect from the wiki."""
+        started = time.monotonic()
+
+        namespaces = set()
+        data = await self._get(
+            http, api, {"meta": "siteinfo", "siprop": "namespaces|namespacealiases"}
+        )
+        query = data.get("query", {})
+        for ns in query.get("namespaces", {}).values():
+            if ns.get("id"):
+                namespaces.add(ns.get("name", "").casefold())
+                if canonical := ns.get("canonical"):
+                    namespaces.add(canonical.casefold())
+        for alias in query.get("namespacealiases", []):
+            namespaces.add(alias.get("alias", "").casefold())
+        namespaces.discard("")
+
+        ids: dict[int, str] = {}
+        entries: dict[str, str] = {}
+        params = {"list": "allpages", "apnamespace": "0", "aplimit": "max"}
+        async for batch in self._paginate(http, api, params):
+            for page in batch.get("allpages", []):
+                ids[page["pageid"]] = page["title"]
+                entries[page["title"]] = page["title"]
+
+        params = {
+            "list": "allredirects",
+            "arnamespace": "0",
+            "arprop": "ids|title",
+            "arlimit": "max",
+        }
+        async for batch in self._paginate(http, api, params):
+            for redirect in batch.get("allredirects", []):
+                source = ids.get(redirect.get("fromid"))
+                if source:
+                    entries[source] = redirect["title"]
+
+        self._namespaces = namespaces
+        self._rebuild(entries)
+        self.built_at = time.time()
+        self.ready = True
+        logger.info(
+            f"Built wiki index with {len(self)} titles in "
+            f"{time.monotonic() - started:.1f}s"
+        )
+        await self.save()
+
+    async def _paginate(self, http, api, params):
+        params = dict(params)
+        while True:
+            data = await self._get(http, api, params)
+            yield data.get("query", {})
+            cont = data.get("continue")
+            if not cont:
+                return
+            params.update(cont)
+
+    @staticmethod
+    async def _get(http, api, params) -> dict:
+        params = {"action": "query", "format": "json", **params}
+        resp = await http.get(api, params=params)
+        resp.raise_for_status()
+        return resp.json()
+